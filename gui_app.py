@@ -13,7 +13,7 @@ import threading
 import queue
 import time
 import math
-from image_encryptor import TextToImageEncryptor, ImageToTextDecryptor, FileToImageEncryptor, ImageToFileDecryptor, is_image_file, is_text_file
+from image_encryptor import TextToImageEncryptor, ImageToTextDecryptor, FileToImageEncryptor, ImageToFileDecryptor, is_image_file, is_text_file, plan, pack_file_header, digits_per_byte
 
 
 class ImageEncryptorApp:
@@ -107,8 +107,8 @@ class ImageEncryptorApp:
         # 参数设置
         ttk.Label(control_frame, text="参数设置:").grid(row=3, column=0, sticky=tk.W, pady=5)
         
-        ttk.Label(control_frame, text="最大宽度:").grid(row=4, column=0, sticky=tk.W, pady=2)
-        self.max_width_var = tk.IntVar(value=800)
+        ttk.Label(control_frame, text="最大宽度(或auto):").grid(row=4, column=0, sticky=tk.W, pady=2)
+        self.max_width_var = tk.StringVar(value='800')  # 像素宽度，或auto自动布局
         ttk.Entry(control_frame, textvariable=self.max_width_var, width=10).grid(row=4, column=1, sticky=tk.W, pady=2)
         
         ttk.Label(control_frame, text="块宽度:").grid(row=5, column=0, sticky=tk.W, pady=2)
@@ -399,8 +399,8 @@ class ImageEncryptorApp:
         # 参数设置
         ttk.Label(control_frame, text="参数设置:").grid(row=5, column=0, sticky=tk.W, pady=5)
         
-        ttk.Label(control_frame, text="最大宽度:").grid(row=6, column=0, sticky=tk.W, pady=2)
-        self.file_max_width_var = tk.IntVar(value=800)
+        ttk.Label(control_frame, text="最大宽度(或auto):").grid(row=6, column=0, sticky=tk.W, pady=2)
+        self.file_max_width_var = tk.StringVar(value='800')  # 像素宽度，或auto自动布局
         ttk.Entry(control_frame, textvariable=self.file_max_width_var, width=10).grid(row=6, column=1, sticky=tk.W, pady=2)
         
         ttk.Label(control_frame, text="块宽度:").grid(row=7, column=0, sticky=tk.W, pady=2)
@@ -574,6 +574,22 @@ class ImageEncryptorApp:
             messagebox.showwarning("警告", "请选择保存路径")
             return
         
+        # 编码之前先估算图片尺寸，超过像素限制时直接询问是否继续
+        try:
+            layout_plan = plan(
+                len(text.encode('utf-8')),
+                base=self.base_var.get(),
+                block_width=self.block_width_var.get(),
+                block_height=self.block_height_var.get(),
+                layout=self.max_width_var.get()
+            )
+        except (ValueError, tk.TclError) as e:
+            messagebox.showwarning("警告", f"参数设置无效: {str(e)}")
+            return
+        if not layout_plan.within_limit:
+            self.message_queue.put(("pixel_limit_error", self._plan_limit_message(layout_plan), text, save_path))
+            return
+        
         # 禁用加密按钮，防止重复点击
         for widget in self.encrypt_tab.winfo_children():
             if isinstance(widget, ttk.Frame):
@@ -942,6 +958,24 @@ class ImageEncryptorApp:
             messagebox.showwarning("警告", "请选择保存路径")
             return
         
+        # 编码之前先估算图片尺寸，超过像素限制时直接询问是否继续
+        if os.path.exists(file_path):
+            try:
+                header = pack_file_header(os.path.basename(file_path), 0)
+                layout_plan = plan(
+                    os.path.getsize(file_path) + len(header),
+                    base=self.file_base_var.get(),
+                    block_width=self.file_block_width_var.get(),
+                    block_height=self.file_block_height_var.get(),
+                    layout=self.file_max_width_var.get()
+                )
+            except (ValueError, tk.TclError) as e:
+                messagebox.showwarning("警告", f"参数设置无效: {str(e)}")
+                return
+            if not layout_plan.within_limit:
+                self.message_queue.put(("pixel_limit_error", self._plan_limit_message(layout_plan), file_path, save_path))
+                return
+        
         # 禁用加密按钮，防止重复点击
         for widget in self.file_encrypt_tab.winfo_children():
             if isinstance(widget, ttk.Frame):
@@ -956,6 +990,12 @@ class ImageEncryptorApp:
         # 启动后台线程执行加密操作
         threading.Thread(target=self._encrypt_file_thread, args=(file_path, save_path), daemon=True).start()
     
+    def _plan_limit_message(self, layout_plan):
+        """根据尺寸估算结果生成超过像素限制的提示"""
+        return (f"预计生成的图片尺寸过大 ({layout_plan.width}x{layout_plan.height} = {layout_plan.pixels} 像素，"
+                f"约需内存 {layout_plan.memory_bytes / (1024 * 1024):.0f} MB)，可能存在安全风险。"
+                f"请减少数据长度或增加块大小。")
+    
     def _encrypt_file_thread(self, file_path, save_path, ignore_pixel_limit=False):
         """在后台线程中执行文件加密操作"""
         try:
@@ -1352,8 +1392,8 @@ class ImageEncryptorApp:
             max_height = 600
             max_pixels = 50000000  # 50兆像素
             
-            # 估算需要的字符数（Base64编码后大约是原文件的1.33倍）
-            estimated_chars = int(file_size * 1.33 * 1.5)  # 1.5是安全系数
+            # 估算需要的位数（原生文件容器中每个字节固定占digits_per_byte位）
+            estimated_chars = int(file_size * digits_per_byte(base_value) * 1.5)  # 1.5是安全系数
             
             # 计算最小块大小以确保不超过最大像素
             if estimated_chars > 0:
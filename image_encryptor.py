@@ -1,285 +1,1675 @@
 import os
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, ImageColor, PngImagePlugin
 import argparse
 import re
 import base64
 import mimetypes
 import binascii
+import functools
+import collections
+import types
+import struct
+import json
+import glob
+import zlib
+import sys
+import time
+import contextlib
+import concurrent.futures
+from multiprocessing import shared_memory
+
+# 单张图片的最大像素数（50兆像素），超过时需要显式忽略限制
+MAX_PIXELS = 50000000
+
+# 进制字符表，下标即为该字符代表的数值
+DIGIT_CHARS = '0123456789ABCDEF'
+_DIGIT_CHAR_CODES = np.frombuffer(DIGIT_CHARS.encode('ascii'), dtype=np.uint8)
+
+
+@functools.lru_cache(maxsize=None)
+def _byte_digit_table(base):
+    """
+    预先计算0-255每个字节在指定进制下的数字展开
+    :param base: 进制，支持2-16
+    :return: (数字表, 长度表)。数字表形状为(256, 最大位数)，右对齐并以0补齐；
+             长度表给出每个字节实际输出的位数（至少两位）
+    """
+    if not 2 <= base <= len(DIGIT_CHARS):
+        raise ValueError(f"不支持的进制: {base}，仅支持2-16进制")
+
+    # 255所需的位数即为表宽
+    width = 1
+    while base ** width <= 255:
+        width += 1
+    width = max(width, 2)
+
+    values = np.arange(256, dtype=np.int64)
+    table = np.zeros((256, width), dtype=np.uint8)
+    remaining = values.copy()
+    for col in range(width - 1, -1, -1):
+        table[:, col] = remaining % base
+        remaining //= base
+
+    # 每个字节的有效位数，至少两位
+    lengths = np.ones(256, dtype=np.int64)
+    remaining = values // base
+    while remaining.any():
+        lengths += remaining > 0
+        remaining //= base
+    lengths = np.maximum(lengths, 2)
+
+    table.setflags(write=False)
+    lengths.setflags(write=False)
+    return table, lengths
+
+
+def digits_per_byte(base):
+    """
+    定长编码时每个字节占用的位数，即表示255所需的位数（至少两位）
+    :param base: 进制，支持2-16
+    :return: 每个字节的位数
+    """
+    return _byte_codec(base).byte_digits.shape[1]
+
+
+def bytes_to_digits(data, base, fixed_width=False):
+    """
+    将字节数据整体转换为进制数字数组（每个元素为0到base-1的数值）
+    :param data: bytes、bytearray、memoryview或np.uint8数组
+    :param base: 进制，支持2-16
+    :param fixed_width: 是否定长编码。默认与文本加密一致，每个字节至少两位、不补多余的0；
+                        定长时每个字节固定为digits_per_byte(base)位，可无歧义地还原
+    :return: np.uint8数字数组
+    """
+    if isinstance(data, np.ndarray):
+        buffer = data.astype(np.uint8, copy=False).ravel()
+    else:
+        buffer = np.frombuffer(data, dtype=np.uint8)
+    codec = _byte_codec(base)
+    table, lengths = codec.byte_digits, codec.byte_lengths
+
+    expanded = table[buffer]
+    if fixed_width or (lengths == table.shape[1]).all():
+        # 所有字节位数相同，直接展平即可
+        return expanded.ravel()
+
+    # 位数不一致时，用掩码去掉每个字节多余的前导0
+    columns = np.arange(table.shape[1])
+    mask = columns >= (table.shape[1] - lengths)[:, None]
+    return expanded[mask[buffer]]
+
+
+def fixed_digits_to_bytes(digits, base):
+    """
+    将定长编码的进制数字数组还原为字节数据，是bytes_to_digits(fixed_width=True)的逆过程
+    :param digits: 进制数字数组，末尾不足一个字节的部分会被忽略
+    :param base: 进制，支持2-16
+    :return: bytes对象
+    """
+    width = digits_per_byte(base)
+    digits = np.asarray(digits, dtype=np.uint8)
+    groups = digits[:len(digits) // width * width].reshape(-1, width)
+
+    # 按位权一次性相乘累加
+    weights = base ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    values = groups @ weights
+    if (groups >= base).any() or (values > 255).any():
+        raise ValueError(f"数据与{base}进制定长编码不符，可能是进制或块尺寸设置错误")
+    return values.astype(np.uint8).tobytes()
+
+
+def digits_to_string(digits):
+    """
+    将进制数字数组转换为字符串形式
+    :param digits: 进制数字数组
+    :return: 进制字符串
+    """
+    return _DIGIT_CHAR_CODES[np.asarray(digits, dtype=np.uint8)].tobytes().decode('ascii')
+
+
+def string_to_digits(base_string):
+    """
+    将进制字符串转换为数字数组，大小写均可
+    :param base_string: 进制字符串
+    :return: np.uint8数字数组，无法识别的字符记为255
+    """
+    char_table = np.full(256, 255, dtype=np.uint8)
+    for value, char in enumerate(DIGIT_CHARS):
+        char_table[ord(char)] = value
+        char_table[ord(char.lower())] = value
+    codes = np.frombuffer(base_string.encode('ascii', errors='replace'), dtype=np.uint8)
+    return char_table[codes]
+
+
+def bytes_to_text(byte_data):
+    """
+    将解密出的字节数据转换为文本
+    :param byte_data: bytes对象
+    :return: 文本，UTF-8解码失败时每个字节视为一个字符，空字符被移除
+    """
+    try:
+        # 使用UTF-8解码字节
+        decoded_text = byte_data.decode('utf-8')
+        # 移除可能的空字符
+        return decoded_text.replace('\x00', '')
+    except UnicodeDecodeError:
+        # 如果UTF-8解码失败，直接将每个字节视为一个字符（忽略空字符）
+        return byte_data.decode('latin-1').replace('\x00', '')
+
+
+# 不同进制的颜色映射：进制 -> {字符: 颜色名称}
+BASE_COLORS = {
+    2: {  # 二进制
+        '0': 'white',
+        '1': 'black'
+    },
+    3: {  # 三进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'red'
+    },
+    4: {  # 四进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'red'
+    },
+    5: {  # 五进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'yellow',
+        '4': 'red'
+    },
+    6: {  # 六进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'cyan',
+        '4': 'yellow',
+        '5': 'red'
+    },
+    7: {  # 七进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'cyan',
+        '4': 'yellow',
+        '5': 'magenta',
+        '6': 'red'
+    },
+    8: {  # 八进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'cyan',
+        '4': 'yellow',
+        '5': 'magenta',
+        '6': 'orange',
+        '7': 'red'
+    },
+    9: {  # 九进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'cyan',
+        '4': 'yellow',
+        '5': 'magenta',
+        '6': 'orange',
+        '7': 'purple',
+        '8': 'red'
+    },
+    10: {  # 十进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'cyan',
+        '4': 'yellow',
+        '5': 'magenta',
+        '6': 'orange',
+        '7': 'purple',
+        '8': 'pink',
+        '9': 'red'
+    },
+    11: {  # 十一进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'cyan',
+        '4': 'yellow',
+        '5': 'magenta',
+        '6': 'orange',
+        '7': 'purple',
+        '8': 'pink',
+        '9': 'brown',
+        'A': 'red'
+    },
+    12: {  # 十二进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'cyan',
+        '4': 'yellow',
+        '5': 'magenta',
+        '6': 'orange',
+        '7': 'purple',
+        '8': 'pink',
+        '9': 'brown',
+        'A': 'red',
+        'B': 'darkred'
+    },
+    13: {  # 十三进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'cyan',
+        '4': 'yellow',
+        '5': 'magenta',
+        '6': 'orange',
+        '7': 'purple',
+        '8': 'pink',
+        '9': 'brown',
+        'A': 'red',
+        'B': 'darkred',
+        'C': 'maroon'
+    },
+    14: {  # 十四进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'cyan',
+        '4': 'yellow',
+        '5': 'magenta',
+        '6': 'orange',
+        '7': 'purple',
+        '8': 'pink',
+        '9': 'brown',
+        'A': 'red',
+        'B': 'darkred',
+        'C': 'maroon',
+        'D': 'crimson'
+    },
+    15: {  # 十五进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'cyan',
+        '4': 'yellow',
+        '5': 'magenta',
+        '6': 'orange',
+        '7': 'purple',
+        '8': 'pink',
+        '9': 'brown',
+        'A': 'red',
+        'B': 'darkred',
+        'C': 'maroon',
+        'D': 'crimson',
+        'E': 'firebrick'
+    },
+    16: {  # 十六进制
+        '0': 'white',
+        '1': 'blue',
+        '2': 'green',
+        '3': 'cyan',
+        '4': 'yellow',
+        '5': 'magenta',
+        '6': 'orange',
+        '7': 'purple',
+        '8': 'pink',
+        '9': 'brown',
+        'A': 'red',
+        'B': 'darkred',
+        'C': 'maroon',
+        'D': 'crimson',
+        'E': 'firebrick',
+        'F': 'black'
+    }
+}
+
+
+# 解密时用于识别颜色的参考RGB值
+_REFERENCE_COLORS = {
+    'white': (245, 245, 245),
+    'black': (10, 10, 10),
+    'blue': (0, 0, 200),
+    'red': (200, 0, 0),
+    'green': (0, 200, 0),
+    'yellow': (200, 200, 0),
+    'cyan': (0, 200, 200),
+    'magenta': (200, 0, 200),
+    'orange': (255, 165, 0),
+    'purple': (128, 0, 128),
+    'pink': (255, 192, 203),
+    'brown': (165, 42, 42),
+    'darkred': (139, 0, 0),
+    'maroon': (128, 0, 0),
+    'crimson': (220, 20, 60),
+    'firebrick': (178, 34, 34)
+}
+_REFERENCE_COLOR_NAMES = tuple(_REFERENCE_COLORS)
+_REFERENCE_RGB = np.array(list(_REFERENCE_COLORS.values()), dtype=np.int32)
+_WHITE_ID = _REFERENCE_COLOR_NAMES.index('white')
+_WHITE_DISTANCE = 100  # 与所有参考颜色的距离都超过该值时视为白色背景
+_SKIP_DIGIT = 255  # 颜色到数字映射表中表示“忽略该块”的标记
+_CLASSIFY_CHUNK = 1 << 18  # 批量识别颜色时每段的像素数
+_LUT_BITS = 5  # 颜色查找表每个通道保留的高位数，即32x32x32个格子
+_LUT_AMBIGUOUS = 255  # 查找表中表示“格子跨越颜色边界，需要精确计算”的标记
+
+
+def _nearest_color_ids(samples):
+    """
+    按与参考颜色的距离精确识别一组RGB值
+    :param samples: 形状为(N, 3)的RGB数组
+    :return: 形状为(N,)的颜色编号数组，对应_REFERENCE_COLOR_NAMES中的下标
+    """
+    color_ids = np.empty(len(samples), dtype=np.uint8)
+    # 分段计算，避免距离矩阵占用过多内存
+    for start in range(0, len(samples), _CLASSIFY_CHUNK):
+        chunk = samples[start:start + _CLASSIFY_CHUNK].astype(np.int32)
+        distances = ((chunk[:, None, :] - _REFERENCE_RGB[None, :, :]) ** 2).sum(axis=2)
+        nearest = distances.argmin(axis=1)
+        # 如果距离太大，可能是白色背景
+        too_far = distances[np.arange(len(chunk)), nearest] > _WHITE_DISTANCE ** 2
+        nearest[too_far] = _WHITE_ID
+        color_ids[start:start + len(chunk)] = nearest
+    return color_ids
+
+
+@functools.lru_cache(maxsize=None)
+def _color_lookup_table():
+    """
+    预先计算量化RGB到颜色编号的查找表，整个进程只构建一次，所有解密器共用。
+    格子的8个角识别结果一致时记录该颜色，否则标记为需要精确计算
+    :return: 形状为(32, 32, 32)的只读np.uint8数组
+    """
+    shift = 8 - _LUT_BITS
+    cell = np.arange(1 << _LUT_BITS, dtype=np.int32) << shift
+    grid = np.stack(np.meshgrid(cell, cell, cell, indexing='ij'), axis=-1).reshape(-1, 3)
+
+    table = None
+    for corner in np.ndindex(2, 2, 2):
+        ids = _nearest_color_ids(grid + np.array(corner) * ((1 << shift) - 1))
+        if table is None:
+            table = ids
+        else:
+            table[table != ids] = _LUT_AMBIGUOUS
+    table = table.reshape((1 << _LUT_BITS,) * 3)
+    table.setflags(write=False)
+    return table
+
+
+def classify_colors(samples):
+    """
+    将一组RGB值批量识别为参考颜色编号：查表得到结果，只有落在颜色边界附近的值才精确计算。
+    分段处理，临时数组只与分段大小有关
+    :param samples: 形状为(N, 3)的np.uint8 RGB数组
+    :return: 形状为(N,)的颜色编号数组，对应_REFERENCE_COLOR_NAMES中的下标
+    """
+    samples = np.asarray(samples, dtype=np.uint8)
+    table = _color_lookup_table().ravel()
+    shift = 8 - _LUT_BITS
+    color_ids = np.empty(len(samples), dtype=np.uint8)
+    for start in range(0, len(samples), _CLASSIFY_CHUNK):
+        chunk = samples[start:start + _CLASSIFY_CHUNK]
+        # 先在uint8上移位，再组合为int32的平铺下标，不把整个RGB数组扩展为intp
+        cells = (chunk[:, 0] >> shift).astype(np.int32) << (2 * _LUT_BITS)
+        cells |= (chunk[:, 1] >> shift).astype(np.int32) << _LUT_BITS
+        cells |= chunk[:, 2] >> shift
+        ids = color_ids[start:start + len(chunk)]
+        np.take(table, cells, out=ids)
+
+        ambiguous = np.flatnonzero(ids == _LUT_AMBIGUOUS)
+        if len(ambiguous):
+            # 边界格子中通常只有少数几种颜色（如恰好位于格子角上的栗色），去重后每种只精确计算一次
+            rgb = chunk[ambiguous]
+            keys = (rgb[:, 0].astype(np.int32) << 16) | (rgb[:, 1].astype(np.int32) << 8) | rgb[:, 2]
+            unique_keys, inverse = np.unique(keys, return_inverse=True)
+            unique_rgb = np.stack([unique_keys >> 16, (unique_keys >> 8) & 0xFF, unique_keys & 0xFF], axis=1)
+            ids[ambiguous] = _nearest_color_ids(unique_rgb)[inverse.ravel()]
+    return color_ids
+
+
+# 块采样方式：center只读取每个块中心的一个像素；mean和median取每个块内部窗口的
+# 平均值或中位数，用于经过有损压缩或轻微缩放的图片
+SAMPLERS = ('center', 'mean', 'median')
+_SAMPLE_MARGIN = 4  # 窗口在每边去掉块尺寸的1/4，避开被相邻块颜色污染的边缘
+
+
+# 每个进制的编解码表：颜色映射、渲染调色板、颜色编号到数字的映射，以及字节到数字的展开表
+Codec = collections.namedtuple('Codec', [
+    'base', 'colors', 'palette', 'color_digits', 'color_digits_with_background', 'byte_digits', 'byte_lengths'
+])
+
+
+@functools.lru_cache(maxsize=None)
+def get_codec(base):
+    """
+    获取指定进制的编解码表，首次使用时构建，整个进程共用且只读。
+    不在BASE_COLORS中的进制按二进制的颜色映射处理
+    :param base: 进制
+    :return: Codec
+    """
+    if base not in BASE_COLORS:
+        return get_codec(2)
+    colors = types.MappingProxyType(BASE_COLORS[base])
+
+    # 调色板依次为各字符的颜色、无法识别字符使用的黑色、背景白色
+    palette = [ImageColor.getrgb(colors[char]) for char in DIGIT_CHARS[:len(colors)]]
+    palette.append(ImageColor.getrgb('black'))
+    palette.append(ImageColor.getrgb('white'))
+    palette = np.array(palette, dtype=np.uint8)
+
+    # 颜色编号到数字：不属于该进制的颜色记为0，白色背景在不保留背景的表中标记为忽略
+    color_to_char = {color: char for char, color in colors.items()}
+    with_background = np.zeros(len(_REFERENCE_COLOR_NAMES), dtype=np.uint8)
+    for color_id, color in enumerate(_REFERENCE_COLOR_NAMES):
+        if color in color_to_char:
+            with_background[color_id] = DIGIT_CHARS.index(color_to_char[color])
+    without_background = with_background.copy()
+    without_background[_WHITE_ID] = _SKIP_DIGIT
+
+    byte_digits, byte_lengths = _byte_digit_table(base)
+    for table in (palette, with_background, without_background):
+        table.setflags(write=False)
+    return Codec(base, colors, palette, without_background, with_background, byte_digits, byte_lengths)
+
+
+def _byte_codec(base):
+    """
+    获取字节与数字互转使用的编解码表。与get_codec不同，不支持的进制直接报错，不按二进制处理
+    :param base: 进制，支持2-16
+    :return: Codec
+    """
+    if base not in BASE_COLORS:
+        raise ValueError(f"不支持的进制: {base}，仅支持2-16进制")
+    return get_codec(base)
+
+
+@functools.lru_cache(maxsize=None)
+def _bases_by_color():
+    """
+    颜色名称到使用该颜色的进制集合的反向映射，用于自动识别进制
+    :return: 只读映射 {颜色名称: frozenset(进制)}
+    """
+    bases = collections.defaultdict(set)
+    for base, colors in BASE_COLORS.items():
+        for color in colors.values():
+            bases[color].add(base)
+    return types.MappingProxyType({color: frozenset(values) for color, values in bases.items()})
+
+
+# 原生文件容器格式：魔数、标志位、文件名长度、数据大小，随后是UTF-8文件名、
+# 分块信息（仅分块文件）和原始文件数据
+FILE_CONTAINER_MAGIC = b'TXIF'
+FILE_FLAG_PART = 0x01  # 容器只包含大文件的一个分块
+_FILE_HEADER = struct.Struct('>4sBHQ')
+_PART_INFO = struct.Struct('>IIQQ')  # 分块序号、分块总数、分块在文件中的偏移、文件总大小
+
+# 解析出的原生文件容器
+FileContainer = collections.namedtuple(
+    'FileContainer',
+    ['file_name', 'flags', 'data', 'part_index', 'part_count', 'offset', 'total_size']
+)
+
+
+def pack_file_header(file_name, file_size, flags=0, part=None):
+    """
+    生成原生文件容器的头部
+    :param file_name: 文件名
+    :param file_size: 本容器中数据的大小（字节）
+    :param flags: 标志位
+    :param part: 分块信息 (分块序号, 分块总数, 偏移, 文件总大小)，为None表示完整文件
+    :return: 头部字节（含文件名和分块信息）
+    """
+    name_bytes = file_name.encode('utf-8')
+    if part is not None:
+        flags |= FILE_FLAG_PART
+    header = _FILE_HEADER.pack(FILE_CONTAINER_MAGIC, flags, len(name_bytes), file_size) + name_bytes
+    if part is not None:
+        header += _PART_INFO.pack(*part)
+    return header
+
+
+def file_container_length(header):
+    """
+    根据容器开头的固定头部计算整个容器的长度
+    :param header: 至少包含固定头部的字节数据
+    :return: 容器总长度（字节）
+    """
+    if len(header) < _FILE_HEADER.size or not header.startswith(FILE_CONTAINER_MAGIC):
+        raise ValueError("图片中不包含有效的文件加密信息")
+
+    _, flags, name_length, file_size = _FILE_HEADER.unpack_from(header)
+    part_length = _PART_INFO.size if flags & FILE_FLAG_PART else 0
+    return _FILE_HEADER.size + name_length + part_length + file_size
+
+
+def unpack_file_container(data):
+    """
+    解析原生文件容器
+    :param data: 容器字节数据，末尾允许有多余的填充
+    :return: FileContainer
+    """
+    total = file_container_length(data)
+    _, flags, name_length, file_size = _FILE_HEADER.unpack_from(data)
+    if len(data) < total:
+        raise ValueError(f"文件数据不完整: 需要 {total} 字节，实际只有 {len(data)} 字节")
+
+    name_end = _FILE_HEADER.size + name_length
+    file_name = data[_FILE_HEADER.size:name_end].decode('utf-8')
+
+    if flags & FILE_FLAG_PART:
+        part_index, part_count, offset, total_size = _PART_INFO.unpack_from(data, name_end)
+        name_end += _PART_INFO.size
+    else:
+        part_index, part_count, offset, total_size = 0, 1, 0, file_size
+
+    return FileContainer(file_name, flags, data[name_end:name_end + file_size],
+                         part_index, part_count, offset, total_size)
+
+
+# 图片格式头：写在图片开头的若干像素行中，每个像素表示一个比特（黑色为1、白色为0），
+# 与块尺寸无关，解密时无需事先知道进制和块尺寸。带格式头的图片总是使用定长编码
+IMAGE_HEADER_MAGIC = b'TXIM'
+IMAGE_HEADER_VERSION = 1
+# 魔数、版本、标志位（保留）、进制、块宽度、块高度、每行块数、位数、数字数组的CRC32
+_IMAGE_HEADER = struct.Struct('>4sBBBBBIQI')
+IMAGE_HEADER_BITS = _IMAGE_HEADER.size * 8
+_HEADER_MIN_WIDTH = 32  # 带格式头的图片的最小宽度，格式头最多占用7行
+DENSE_BLOCK_SIZE = 1  # 像素密集模式下每位的宽度和高度
+
+# 解析出的图片格式头
+ImageHeader = collections.namedtuple(
+    'ImageHeader',
+    ['version', 'flags', 'base', 'block_width', 'block_height', 'columns', 'digit_count', 'crc32']
+)
+
+
+def pack_image_header(base, block_width, block_height, columns, digits, flags=0):
+    """
+    生成图片格式头
+    :param base: 进制
+    :param block_width: 每个块的宽度（像素）
+    :param block_height: 每个块的高度（像素）
+    :param columns: 每行块数
+    :param digits: 图片中的进制数字数组
+    :param flags: 标志位
+    :return: 格式头字节
+    """
+    if not (0 < block_width < 256 and 0 < block_height < 256):
+        raise ValueError(f"带格式头的图片块尺寸必须在1-255之间: {block_width}x{block_height}")
+    digits = np.ascontiguousarray(digits, dtype=np.uint8)
+    return _IMAGE_HEADER.pack(IMAGE_HEADER_MAGIC, IMAGE_HEADER_VERSION, flags, base, block_width, block_height,
+                              columns, len(digits), zlib.crc32(digits.tobytes()))
+
+
+def image_header_rows(width):
+    """
+    计算指定宽度的图片中格式头占用的像素行数
+    :param width: 图片宽度（像素）
+    :return: 行数
+    """
+    return (IMAGE_HEADER_BITS + width - 1) // width
+
+
+def image_header_bits(header, width):
+    """
+    将格式头展开为像素行
+    :param header: 格式头字节
+    :param width: 图片宽度（像素）
+    :return: 形状为(行数, width)的布尔数组，True表示黑色
+    """
+    rows = image_header_rows(width)
+    bits = np.zeros(rows * width, dtype=bool)
+    bits[:IMAGE_HEADER_BITS] = np.unpackbits(np.frombuffer(header, dtype=np.uint8))
+    return bits.reshape(rows, width)
+
+
+def read_image_header(img):
+    """
+    读取图片开头的格式头，只需转换格式头所在的几行像素
+    :param img: PIL图像对象
+    :return: ImageHeader，图片不含格式头时返回None
+    """
+    width, height = img.size
+    if width == 0 or image_header_rows(width) > height:
+        return None
+
+    region = img.crop((0, 0, width, image_header_rows(width)))
+    bits = np.asarray(region.convert('L')).ravel()[:IMAGE_HEADER_BITS] < 128
+    fields = _IMAGE_HEADER.unpack(np.packbits(bits).tobytes())
+    if fields[0] != IMAGE_HEADER_MAGIC:
+        return None
+
+    header = ImageHeader(*fields[1:])
+    if header.version != IMAGE_HEADER_VERSION:
+        raise ValueError(f"不支持的图片格式头版本: {header.version}")
+
+    # 校验格式头与图片尺寸是否一致
+    rows = (header.digit_count + header.columns - 1) // header.columns if header.columns else 0
+    if (not 2 <= header.base <= 16 or header.block_width == 0 or header.block_height == 0
+            or (header.digit_count and header.columns == 0)
+            or header.columns * header.block_width > width
+            or image_header_rows(width) + rows * header.block_height > height):
+        raise ValueError("图片格式头已损坏或与图片尺寸不一致")
+    return header
+
+
+# PNG扫描线滤波类型
+PNG_FILTER_NONE = 0
+PNG_FILTER_UP = 2
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_PNG_IDAT_SIZE = 1 << 16  # 压缩数据累积到该大小时写出一个IDAT块
+_STREAM_BLOCK_ROWS = 64  # 流式写入时每批处理的块行数
+
+
+class PNGStreamWriter:
+    """
+    增量PNG写入器：扫描线经zlib压缩后立即写入IDAT块，内存占用与图片高度无关
+    """
+
+    def __init__(self, file_path, width, height, color_type=2, bit_depth=8, palette=None, compress_level=6,
+                 text=None):
+        """
+        初始化写入器并写出文件头
+        :param file_path: 输出文件路径
+        :param width: 图片宽度
+        :param height: 图片高度
+        :param color_type: PNG颜色类型，2为RGB，3为调色板
+        :param bit_depth: 位深度
+        :param palette: 调色板RGB数组，颜色类型为3时必须提供
+        :param compress_level: zlib压缩级别
+        :param text: 写在图像数据之前的文本块 {关键字: 文本}，Latin-1无法表示的文本写为iTXt
+        """
+        self.file_path = file_path
+        self.width = width
+        self.height = height
+        self._rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = []
+        self._pending_size = 0
+        self._file = open(file_path, 'wb')
+
+        try:
+            self._file.write(_PNG_SIGNATURE)
+            self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, bit_depth, color_type, 0, 0, 0))
+            if palette is not None:
+                self._write_chunk(b'PLTE', np.asarray(palette, dtype=np.uint8).tobytes())
+            for key, value in (text or {}).items():
+                keyword = key.encode('latin-1')
+                try:
+                    self._write_chunk(b'tEXt', keyword + b'\0' + value.encode('latin-1'))
+                except UnicodeEncodeError:
+                    # 未压缩的iTXt：关键字、压缩标志、压缩方法、语言标签、翻译后的关键字、UTF-8文本
+                    self._write_chunk(b'iTXt', keyword + b'\0\0\0\0\0' + value.encode('utf-8'))
+        except BaseException:
+            self.abort()
+            raise
+
+    def write_scanlines(self, scanlines):
+        """
+        写入已滤波的扫描线
+        :param scanlines: 形状为(..., 1 + 每行字节数)的np.uint8数组，每行首字节为滤波类型
+        """
+        scanlines = np.ascontiguousarray(scanlines, dtype=np.uint8)
+        self._rows_written += scanlines.size // scanlines.shape[-1]
+        self._append(self._compressor.compress(scanlines.tobytes()))
+
+    def write_rows(self, rows):
+        """
+        写入未滤波的像素行
+        :param rows: 形状为(行数, 每行字节数)的np.uint8数组
+        """
+        rows = np.asarray(rows, dtype=np.uint8).reshape(len(rows), -1)
+        scanlines = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        scanlines[:, 0] = PNG_FILTER_NONE
+        scanlines[:, 1:] = rows
+        self.write_scanlines(scanlines)
+
+    def close(self):
+        """
+        写出剩余的压缩数据和文件尾，失败时删除不完整的文件
+        """
+        if self._file is None:
+            return
+        try:
+            if self._rows_written != self.height:
+                raise ValueError(f"PNG行数不符: 需要 {self.height} 行，实际写入 {self._rows_written} 行")
+            self._append(self._compressor.flush())
+            self._flush_idat()
+            self._write_chunk(b'IEND', b'')
+        except BaseException:
+            self.abort()
+            raise
+        self._file.close()
+        self._file = None
+
+    def abort(self):
+        """
+        放弃写入：关闭并删除不完整的文件
+        """
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+    def _append(self, data):
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+            if self._pending_size >= _PNG_IDAT_SIZE:
+                self._flush_idat()
+
+    def _flush_idat(self):
+        if self._pending_size:
+            self._write_chunk(b'IDAT', b''.join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # 出错时不再校验行数，直接删除不完整的文件
+            self.abort()
+            return False
+        self.close()
+        return False
+
+
+# PNG文本块中编码参数的关键字前缀和格式版本。文本块位于图像数据之前，
+# Image.open只读取文件头即可得到这些参数，无需解码像素
+PNG_METADATA_PREFIX = 'txim:'
+PNG_METADATA_VERSION = 1
+_PNG_METADATA_INT_FIELDS = (
+    'version', 'base', 'block_width', 'block_height', 'columns', 'rows', 'digits', 'header', 'fixed_width',
+    'part_index', 'part_count', 'shard_index', 'shard_count', 'file_size'
+)
+
+
+def png_text_chunks(metadata):
+    """
+    将编码参数转换为PNG文本块
+    :param metadata: 编码参数字典
+    :return: {关键字: 文本}，关键字带有PNG_METADATA_PREFIX前缀
+    """
+    return {PNG_METADATA_PREFIX + key: str(value) for key, value in metadata.items()}
+
+
+def png_info(metadata):
+    """
+    生成PIL保存PNG时使用的文本块信息
+    :param metadata: 编码参数字典
+    :return: PngImagePlugin.PngInfo
+    """
+    info = PngImagePlugin.PngInfo()
+    for key, value in png_text_chunks(metadata).items():
+        # Latin-1无法表示的文本（如中文文件名）自动写为iTXt
+        info.add_text(key, value)
+    return info
+
+
+def read_png_metadata(img):
+    """
+    从Image.open得到的图像信息中读取编码参数，不会解码像素数据
+    :param img: PIL图像对象
+    :return: 编码参数字典，整数字段已转换为int；图片中没有编码参数时返回None
+    """
+    metadata = {key[len(PNG_METADATA_PREFIX):]: value for key, value in img.info.items()
+                if isinstance(key, str) and key.startswith(PNG_METADATA_PREFIX)}
+    if not metadata:
+        return None
+    try:
+        for key in _PNG_METADATA_INT_FIELDS:
+            if key in metadata:
+                metadata[key] = int(metadata[key])
+    except ValueError:
+        raise ValueError(f"图片中的编码参数无效: {metadata}")
+    if metadata.get('version') != PNG_METADATA_VERSION:
+        raise ValueError(f"不支持的编码参数版本: {metadata.get('version')}")
+    return metadata
+
+
+def inspect_image(img_path):
+    """
+    读取图片的编码参数，用于检查或分发大量图片。优先读取PNG文本块（只需读取文件头），
+    没有文本块时读取图片开头的格式头
+    :param img_path: 图片路径
+    :return: 编码参数字典（包括图片宽高），不是加密图片时返回None
+    """
+    with Image.open(img_path) as img:
+        metadata = read_png_metadata(img)
+        if metadata is None:
+            header = read_image_header(img)
+            if header is None:
+                return None
+            metadata = {
+                'version': PNG_METADATA_VERSION,
+                'base': header.base,
+                'block_width': header.block_width,
+                'block_height': header.block_height,
+                'columns': header.columns,
+                'rows': (header.digit_count + header.columns - 1) // header.columns if header.columns else 0,
+                'digits': header.digit_count,
+                'header': 1,
+                'fixed_width': 1,
+            }
+        metadata['width'], metadata['height'] = img.size
+    return metadata
+
+
+# 加密图片支持的输出模式：24位彩色、调色板索引、1位黑白
+IMAGE_MODES = ('RGB', 'P', '1')
+
+
+def _white_entries(palette):
+    """
+    标记调色板中的白色项，用于1位黑白输出
+    :param palette: 调色板RGB数组
+    :return: 布尔数组，白色为True
+    """
+    return (palette == 255).all(axis=1)
+
+
+# 多线程按块行分段处理时每段至少包含的像素数，较小的图片不值得拆分
+_BAND_MIN_PIXELS = 1 << 20
+
+
+def _band_ranges(rows, row_pixels, workers):
+    """
+    将块行划分为若干段，供多个线程分别处理
+    :param rows: 块的行数
+    :param row_pixels: 每个块行包含的像素数
+    :param workers: 线程数
+    :return: [(起始块行, 结束块行)]，按顺序排列
+    """
+    if workers <= 1 or rows <= 1:
+        return [(0, rows)]
+    # 每个线程分到几段，避免个别段耗时较长时其余线程空闲
+    bands = min(rows, workers * 2, max(1, rows * row_pixels // _BAND_MIN_PIXELS))
+    bounds = np.linspace(0, rows, bands + 1).astype(int)
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def _map_bands(function, bands, workers):
+    """
+    在线程池中处理各段。NumPy的复制和查表操作会释放GIL，各段可以真正并行
+    :param function: function(起始块行, 结束块行)，返回该段的结果
+    :param bands: _band_ranges返回的分段
+    :param workers: 线程数
+    :return: 按分段顺序排列的结果列表
+    """
+    if workers <= 1 or len(bands) <= 1:
+        return [function(start, stop) for start, stop in bands]
+    with concurrent.futures.ThreadPoolExecutor(min(workers, len(bands))) as executor:
+        return list(executor.map(lambda band: function(*band), bands))
+
+
+# 分段并行处理的方式：thread在线程池中处理（NumPy操作释放GIL），
+# process在进程池中处理，像素和结果数组通过共享内存传递
+EXECUTORS = ('thread', 'process')
+
+
+class SharedArray:
+    """
+    共享内存中的NumPy数组。进程之间只传递descriptor（名称、形状和类型），
+    各进程直接读写同一块内存，无需序列化数组内容
+    """
+
+    def __init__(self, shape, dtype, name=None):
+        """
+        创建新的共享内存数组，或按名称连接已有的共享内存
+        :param shape: 数组形状
+        :param dtype: 数组类型
+        :param name: 共享内存名称，为None时新建
+        """
+        dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * dtype.itemsize)
+        self._owner = name is None
+        self._shm = shared_memory.SharedMemory(name=name, create=self._owner, size=size if self._owner else 0)
+        self.array = np.ndarray(shape, dtype, buffer=self._shm.buf)
+        self.descriptor = (self._shm.name, tuple(shape), dtype.str)
+
+    @classmethod
+    def attach(cls, descriptor):
+        """
+        在工作进程中按descriptor连接共享内存数组
+        """
+        name, shape, dtype = descriptor
+        return cls(shape, dtype, name)
+
+    def release(self):
+        """
+        断开共享内存，创建者同时释放内存。调用前不能再持有array的视图
+        """
+        self.array = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class LocalArray:
+    """
+    与SharedArray接口相同的普通NumPy数组，用于在当前进程内处理的情况
+    """
+    descriptor = None
+
+    def __init__(self, shape, dtype):
+        self.array = np.empty(shape, dtype)
+
+    def release(self):
+        self.array = None
+
+
+def _map_in_processes(function, tasks, workers):
+    """
+    在进程池中处理各段
+    :param function: 模块级函数，function(*task)
+    :param tasks: 每段的参数元组列表，只应包含共享内存descriptor等小对象
+    :param workers: 进程数
+    :return: 按顺序排列的结果列表
+    """
+    with concurrent.futures.ProcessPoolExecutor(min(workers, len(tasks))) as executor:
+        return list(executor.map(function, *zip(*tasks)))
+
+
+def _render_band_shared(encryptor, pixels, top, grid, table, start, stop):
+    """
+    工作进程中渲染一段块行，直接写入共享内存中的像素数组
+    """
+    shared_target = SharedArray.attach(pixels)
+    shared_grid = SharedArray.attach(grid)
+    try:
+        body = shared_grid.array
+        target = shared_target.array[top:, :body.shape[1] * encryptor.block_width]
+        encryptor._render_band(target, body, table, start, stop)
+        del body, target
+    finally:
+        shared_target.release()
+        shared_grid.release()
+
+
+def _classify_band_shared(decryptor, pixels, color_ids, chars_per_row, entry_rgb, entry_ids, start, stop):
+    """
+    工作进程中识别一段块行，颜色编号直接写入共享内存中的结果数组
+    :return: 这段前10个采样的RGB值
+    """
+    shared_pixels = SharedArray.attach(pixels)
+    shared_ids = SharedArray.attach(color_ids)
+    try:
+        band = shared_pixels.array[start * decryptor.block_height:stop * decryptor.block_height]
+        ids, preview = decryptor._classify_band(band, stop - start, chars_per_row, entry_rgb, entry_ids)
+        shared_ids.array[start * chars_per_row:stop * chars_per_row] = ids
+        # 采样结果可能是共享内存的视图，断开共享内存之前复制出来并丢弃所有视图
+        preview = np.array(preview)
+        del band, ids
+        return preview
+    finally:
+        shared_pixels.release()
+        shared_ids.release()
+
+
+def _index_palette_rgb(img):
+    """
+    获取索引类图片（调色板、1位黑白、8位灰度）中每个索引值对应的RGB颜色
+    :param img: 模式为'P'、'1'或'L'的PIL图像对象
+    :return: 形状为(256, 3)的RGB数组（1位黑白为(2, 3)）
+    """
+    if img.mode == '1':
+        return np.array([[0, 0, 0], [255, 255, 255]], dtype=np.uint8)
+    if img.mode == 'L':
+        return np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3, axis=1)
+
+    # 调色板可能少于256项，缺失的项按黑色处理
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    entries = np.array(img.getpalette() or [], dtype=np.uint8).reshape(-1, 3)[:256]
+    palette[:len(entries)] = entries
+    return palette
+
+
+# 块尺寸设为该值时，解密旧格式图片前从像素数据中检测块网格
+BLOCK_SIZE_AUTO = 'auto'
+
+# 块网格检测：最大块尺寸、每个方向参与统计的像素行（列）数、
+# 块边界至少需要占到的边缘强度比例、与最高得分相比可接受的比例，
+# 以及块边界与其余位置平均边缘强度之比的下限
+_GRID_MAX_PITCH = 256
+_GRID_SAMPLE_LINES = 512
+_GRID_EDGE_SHARE = 0.6
+_GRID_SCORE_TOLERANCE = 0.95
+_GRID_EDGE_CONTRAST = 4
+
+
+def _edge_profile(pixels, axis):
+    """
+    统计沿指定方向相邻像素之间的平均颜色差异
+    :param pixels: 形状为(高, 宽, 3)的RGB数组，或形状为(高, 宽)的索引数组
+    :param axis: 1统计相邻列之间的差异，0统计相邻行之间的差异
+    :return: 长度为该方向像素数减1的数组，第i项为第i与第i+1个像素之间的边缘强度
+    """
+    if axis == 0:
+        pixels = pixels.swapaxes(0, 1)
+    # 块边界在同一块行内的所有像素行上都相同，只需均匀抽取一部分像素行
+    step = max(1, pixels.shape[0] // _GRID_SAMPLE_LINES)
+    lines = pixels[::step].astype(np.int16)
+    diff = np.abs(np.diff(lines, axis=1))
+    if diff.ndim == 3:
+        diff = diff.sum(axis=2)
+    return diff.mean(axis=0)
+
+
+def _detect_pitch(edges):
+    """
+    从边缘强度中找出块的间距和起始偏移：块边界上的边缘强度之和应占全部边缘的绝大部分。
+    间距的约数同样满足条件，倍数则会漏掉一部分边界，因此取得分接近最高分的最大间距；
+    块边界上的平均强度还需明显高于其余位置，否则认为每个像素都是一个块
+    :param edges: _edge_profile返回的边缘强度
+    :return: (间距, 偏移)，没有任何边缘时返回None
+    """
+    if not len(edges) or edges.max() <= 0:
+        return None
+
+    # 减去噪声基线，有损压缩产生的细小差异不计入。间距不小于2时至少一半位置不是块边界，
+    # 取较低的分位数作为基线，避免间距为1时所有边界都被当作噪声
+    signal = np.clip(edges - np.percentile(edges, 25), 0, None)
+    # 有损压缩会把一条边界模糊到相邻几个位置上，只保留局部最大值
+    padded = np.pad(signal, 1)
+    signal = np.where((signal >= padded[:-2]) & (signal >= padded[2:]), signal, 0)
+    total = signal.sum()
+    if total <= 0:
+        return 1, 0
+
+    positions = np.arange(1, len(edges) + 1)
+    scores = []
+    for pitch in range(2, min(_GRID_MAX_PITCH, len(edges)) + 1):
+        shares = np.bincount(positions % pitch, weights=signal, minlength=pitch)
+        offset = int(shares.argmax())
+        scores.append((shares[offset] / total, pitch, offset))
+    best = max((score for score, _, _ in scores), default=0)
+    if best < _GRID_EDGE_SHARE:
+        return 1, 0
+    pitch, offset = max((pitch, offset) for score, pitch, offset in scores
+                        if score >= best * _GRID_SCORE_TOLERANCE)
+
+    on_grid = positions % pitch == offset
+    if edges[on_grid].mean() < _GRID_EDGE_CONTRAST * edges[~on_grid].mean():
+        return 1, 0
+    # 只有一条边界时无法确定间距，边界之后的部分作为一个块
+    if offset and offset + pitch > len(edges) + 1:
+        pitch = len(edges) + 1 - offset
+    return pitch, offset
+
+
+def detect_block_grid(pixels):
+    """
+    从像素数据中检测块网格的尺寸和起始偏移
+    :param pixels: 形状为(高, 宽, 3)的RGB数组，或形状为(高, 宽)的索引数组
+    :return: (块宽度, 水平偏移, 块高度, 垂直偏移)
+    """
+    height, width = pixels.shape[:2]
+    horizontal = _detect_pitch(_edge_profile(pixels, axis=1)) if width > 1 else None
+    vertical = _detect_pitch(_edge_profile(pixels, axis=0)) if height > 1 else None
+
+    # 某个方向上没有任何颜色变化时（如只有一行块），该方向只有一个块
+    block_width, offset_x = horizontal if horizontal is not None else (width, 0)
+    block_height, offset_y = vertical if vertical is not None else (height, 0)
+    return block_width, offset_x, block_height, offset_y
+
+
+# 默认布局：图片最大宽度（像素），超过时自动换行
+DEFAULT_MAX_WIDTH = 800
+# 自动布局时在理想列数两侧搜索的范围：理想列数的1/8，且不超过256列
+_AUTO_LAYOUT_SLACK = 0.125
+_AUTO_LAYOUT_WINDOW = 256
+
+
+def parse_layout(layout):
+    """
+    解析布局参数
+    :param layout: 图片最大宽度（整数或数字字符串），或 'auto'（接近正方形）、
+                   'auto:宽:高'（接近指定宽高比，如 'auto:16:9'）
+    :return: (最大宽度, 宽高比)，固定宽度布局时宽高比为None，自动布局时最大宽度为None
+    """
+    if isinstance(layout, str):
+        parts = layout.strip().lower().split(':')
+        if parts[0] == 'auto':
+            if len(parts) == 1:
+                return None, 1.0
+            if len(parts) == 3:
+                try:
+                    aspect_width, aspect_height = float(parts[1]), float(parts[2])
+                except ValueError:
+                    aspect_width = aspect_height = 0
+                if aspect_width > 0 and aspect_height > 0:
+                    return None, aspect_width / aspect_height
+            raise ValueError(f"无效的布局: {layout}，应为 'auto' 或 'auto:宽:高'")
+        try:
+            layout = int(layout)
+        except ValueError:
+            raise ValueError(f"无效的布局: {layout}，应为最大宽度（像素）、'auto' 或 'auto:宽:高'")
+    if layout <= 0:
+        raise ValueError(f"图片最大宽度必须为正数: {layout}")
+    return int(layout), None
+
+
+def grid_layout(digit_count, block_width, block_height, layout=DEFAULT_MAX_WIDTH):
+    """
+    计算块网格的列数和行数
+    :param digit_count: 位数
+    :param block_width: 每个块的宽度（像素）
+    :param block_height: 每个块的高度（像素）
+    :param layout: 布局，见parse_layout
+    :return: (每行块数, 行数)
+    """
+    max_width, aspect = parse_layout(layout)
+    if digit_count == 0:
+        return 0, 0
+
+    if max_width is not None:
+        # 固定宽度布局：内容不足一行时按实际位数确定宽度
+        chars_per_row = max(1, max_width // block_width)
+        columns = min(chars_per_row, digit_count)
+    else:
+        columns = _auto_columns(digit_count, block_width, block_height, aspect)
+    return columns, (digit_count + columns - 1) // columns
+
+
+def _auto_columns(digit_count, block_width, block_height, aspect):
+    """
+    为自动布局选择列数：在使图片宽高比最接近aspect的列数附近搜索，
+    优先选择末行空位最少（能整除时没有空位）的列数
+    """
+    # columns * block_width / (rows * block_height) = aspect，且 rows = digit_count / columns
+    ideal = (digit_count * block_height * aspect / block_width) ** 0.5
+    ideal = min(max(ideal, 1.0), digit_count)
+    center = int(round(ideal))
+    window = max(1, min(_AUTO_LAYOUT_WINDOW, int(ideal * _AUTO_LAYOUT_SLACK)))
+    candidates = range(max(1, center - window), min(digit_count, center + window) + 1)
+    return min(candidates, key=lambda columns: (-digit_count % columns, abs(columns - ideal)))
+
+
+def grid_capacity(max_pixels, block_width, block_height, layout=DEFAULT_MAX_WIDTH):
+    """
+    计算单张图片在像素上限内按指定布局可以容纳的最大位数
+    :param max_pixels: 像素上限
+    :param block_width: 每个块的宽度（像素）
+    :param block_height: 每个块的高度（像素）
+    :param layout: 布局，见parse_layout
+    :return: 位数
+    """
+    max_width, aspect = parse_layout(layout)
+    if max_width is not None:
+        chars_per_row = max(1, max_width // block_width)
+        max_rows = max_pixels // (chars_per_row * block_width * block_height)
+        return max_rows * chars_per_row
+
+    # 自动布局：取宽高比接近aspect的满格网格，容量恰好可以整除，
+    # 按该容量自动布局时没有空位，像素数不会超过上限
+    max_blocks = max_pixels // (block_width * block_height)
+    if max_blocks == 0:
+        return 0
+    columns = max(1, int((max_blocks * block_height * aspect / block_width) ** 0.5))
+    columns = min(columns, max_blocks)
+    return (max_blocks // columns) * columns
+
+
+# 加密前的尺寸估算结果
+LayoutPlan = collections.namedtuple(
+    'LayoutPlan',
+    ['digits', 'columns', 'rows', 'width', 'height', 'pixels', 'memory_bytes', 'png_bytes', 'within_limit']
+)
+
+# 渲染时每像素占用的内存字节数：numpy像素数组加PIL图像（PIL的RGB图像每像素4字节）
+_RENDER_BYTES_PER_PIXEL = {'RGB': 3 + 4, 'P': 1 + 1, '1': 1 + 1}
+# PNG扫描线每像素的字节数
+_PNG_BYTES_PER_PIXEL = {'RGB': 3, 'P': 1, '1': 1 / 8}
+# 流式写入PNG大小的经验模型（比特），由随机数据的实测结果拟合：
+# (每位 x log2(进制), 块宽超过1字节时每位, 每条全零扫描线, 全零扫描线每258字节, 每个块行)
+_PNG_SIZE_MODEL = {
+    'RGB': (1.93, -0.48, 6.3, 3.98, 294.2),
+    'P': (1.26, 0.7, 13.98, 5.19, 86.3),
+    '1': (1.11, 0.59, -0.42, 16.02, 44.8),
+}
+
+
+def plan(payload_size, base=16, block_width=9, block_height=16, layout=DEFAULT_MAX_WIDTH, image_mode='RGB',
+         streaming=False, embed_header=True):
+    """
+    在编码之前以O(1)的开销估算加密图片的尺寸，用于提前拒绝、分片或选择参数
+    :param payload_size: 载荷字节数（文本为UTF-8编码后的字节数，文件为容器头部加文件大小）。
+                         定长编码时位数是精确的；旧格式文本使用变长编码，16以下的进制按每字节最多位数估算，得到的是上限
+    :param base: 进制，支持2-16
+    :param block_width: 每个块的宽度（像素）
+    :param block_height: 每个块的高度（像素）
+    :param layout: 布局，见parse_layout
+    :param image_mode: 输出图片模式，见IMAGE_MODES
+    :param streaming: 是否按流式写入PNG估算内存
+    :param embed_header: 图片开头是否带格式头（带格式头时总是定长编码），默认与加密器一致
+    :return: LayoutPlan，包括位数、网格列数和行数、图片宽高和像素数、预计峰值内存、
+             预计流式写入的PNG文件大小（字节，随机数据下误差约±30%），以及是否在MAX_PIXELS限制内
+    """
+    if image_mode not in IMAGE_MODES:
+        raise ValueError(f"不支持的图片模式: {image_mode}，可选: {', '.join(IMAGE_MODES)}")
+
+    # 定长编码与16进制的变长编码每字节位数固定，其余进制取每字节的最多位数
+    digits = payload_size * digits_per_byte(base)
+    columns, rows = grid_layout(digits, block_width, block_height, layout)
+    width = columns * block_width
+    height = rows * block_height
+    if embed_header:
+        width = max(width, _HEADER_MIN_WIDTH)
+        height += image_header_rows(width)
+    pixels = width * height
+
+    if image_mode == '1':
+        scanline_bytes = (width + 7) // 8
+    else:
+        scanline_bytes = width * _PNG_BYTES_PER_PIXEL[image_mode]
+    if streaming:
+        # 每批块行的扫描线，加上数字与调色板下标数组
+        memory_bytes = min(rows, _STREAM_BLOCK_ROWS) * block_height * (scanline_bytes + 1) + 2 * digits
+    else:
+        memory_bytes = pixels * _RENDER_BYTES_PER_PIXEL[image_mode]
+
+    # 每个块行第一条扫描线之外都是Up滤波后的全零扫描线
+    per_digit, per_wide_digit, per_zero_line, per_zero_run, per_block_row = _PNG_SIZE_MODEL[image_mode]
+    wide_blocks = block_width * _PNG_BYTES_PER_PIXEL[image_mode] > 1
+    zero_lines = rows * (block_height - 1)
+    png_bits = (digits * (per_digit * float(np.log2(base)) + (per_wide_digit if wide_blocks else 0.0))
+                + zero_lines * (per_zero_line + per_zero_run * scanline_bytes / 258)
+                + rows * per_block_row)
+    # 加上PNG签名、IHDR、IEND以及各IDAT块的开销
+    png_bytes = max(0, int(png_bits / 8)) + 57 + 12 * int(png_bits / 8 // _PNG_IDAT_SIZE)
+
+    return LayoutPlan(digits, columns, rows, width, height, pixels, memory_bytes, png_bytes, pixels <= MAX_PIXELS)
+
+
+# 分片清单的格式版本
+SHARD_MANIFEST_VERSION = 1
+
+
+def resolve_shards(shards):
+    """
+    解析分片输入
+    :param shards: 分片清单(.json)路径、分片图片路径列表或glob模式（如 "out_shard*.png"）
+    :return: (清单字典或None, 按顺序排列的分片图片路径列表)
+    """
+    if isinstance(shards, str) and shards.lower().endswith('.json'):
+        with open(shards, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest.get('version') != SHARD_MANIFEST_VERSION:
+            raise ValueError(f"不支持的分片清单版本: {manifest.get('version')}")
+
+        # 分片路径相对于清单所在目录
+        manifest_dir = os.path.dirname(os.path.abspath(shards))
+        entries = sorted(manifest['shards'], key=lambda entry: entry['index'])
+        return manifest, [os.path.join(manifest_dir, entry['file']) for entry in entries]
+
+    if isinstance(shards, str):
+        paths = sorted(glob.glob(shards))
+    else:
+        paths = list(shards)
+    if not paths:
+        raise ValueError(f"没有找到分片图片: {shards}")
+    return None, paths
+
 
 class TextToImageEncryptor:
-    def __init__(self, block_width=9, block_height=16, base=2):
+    def __init__(self, block_width=9, block_height=16, base=2, image_mode='RGB', embed_header=True, workers=1,
+                 executor='thread'):
         """
         初始化加密器
         :param block_width: 每个位的宽度（像素）
         :param block_height: 每个位的高度（像素）
         :param base: 进制，支持2-16
+        :param image_mode: 输出图片模式，'RGB'为24位彩色，'P'为调色板索引，'1'为1位黑白（仅二进制）
+        :param embed_header: 是否在图片开头写入格式头（进制、块尺寸、位数和CRC），并使用定长编码，
+                             解密时无需指定参数。配合1x1的块即为像素密集模式；为False时生成旧格式图片。
+                             块尺寸超过255像素时无法写入格式头，总是生成旧格式图片
+        :param workers: 生成图片时使用的线程数，大图片按块行分段并行渲染；为None时使用全部CPU核心
+        :param executor: 分段并行的方式，见EXECUTORS；process在进程池中渲染，像素通过共享内存传递
         """
+        if executor not in EXECUTORS:
+            raise ValueError(f"不支持的并行方式: {executor}，可选: {', '.join(EXECUTORS)}")
+        if image_mode not in IMAGE_MODES:
+            raise ValueError(f"不支持的图片模式: {image_mode}，仅支持 {', '.join(IMAGE_MODES)}")
+        if image_mode == '1' and base != 2:
+            raise ValueError("1位黑白模式仅支持二进制")
+        
         self.block_width = block_width
         self.block_height = block_height
         self.base = base
-        
-        # 定义不同进制的颜色映射
-        self.base_colors = {
-            2: {  # 二进制
-                '0': 'white',
-                '1': 'black'
-            },
-            3: {  # 三进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'red'
-            },
-            4: {  # 四进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'red'
-            },
-            5: {  # 五进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'yellow',
-                '4': 'red'
-            },
-            6: {  # 六进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'red'
-            },
-            7: {  # 七进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'red'
-            },
-            8: {  # 八进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'red'
-            },
-            9: {  # 九进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'red'
-            },
-            10: {  # 十进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'red'
-            },
-            11: {  # 十一进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'brown',
-                'A': 'red'
-            },
-            12: {  # 十二进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'brown',
-                'A': 'red',
-                'B': 'darkred'
-            },
-            13: {  # 十三进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'brown',
-                'A': 'red',
-                'B': 'darkred',
-                'C': 'maroon'
-            },
-            14: {  # 十四进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'brown',
-                'A': 'red',
-                'B': 'darkred',
-                'C': 'maroon',
-                'D': 'crimson'
-            },
-            15: {  # 十五进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'brown',
-                'A': 'red',
-                'B': 'darkred',
-                'C': 'maroon',
-                'D': 'crimson',
-                'E': 'firebrick'
-            },
-            16: {  # 十六进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'brown',
-                'A': 'red',
-                'B': 'darkred',
-                'C': 'maroon',
-                'D': 'crimson',
-                'E': 'firebrick',
-                'F': 'black'
-            }
-        }
-        
+        self.image_mode = image_mode
+        self.embed_header = embed_header and block_width < 256 and block_height < 256
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+
     def text_to_binary(self, text):
         """
         将文本转换为指定进制的表示
         :param text: 要转换的文本
         :return: 指定进制的字符串
         """
-        # 将文本转换为UTF-8编码的字节
-        bytes_data = text.encode('utf-8')
-        
-        # 将每个字节转换为指定进制的表示
-        result = ""
-        for byte in bytes_data:
-            # 转换为指定进制
-            base_str = ""
-            value = byte
-            if value == 0:
-                base_str = "0"
-            else:
-                while value > 0:
-                    remainder = value % self.base
-                    if remainder < 10:
-                        base_str = str(remainder) + base_str
-                    else:
-                        # 对于大于9的值，使用A-F表示
-                        base_str = chr(ord('A') + remainder - 10) + base_str
-                    value = value // self.base
-            
-            # 确保每个字节至少有两位（对于大于2的进制）
-            if self.base <= 16:
-                min_length = 2
-            else:
-                min_length = 1
-                
-            while len(base_str) < min_length:
-                base_str = "0" + base_str
-                
-            result += base_str
-            
-        return result
+        # 将文本转换为UTF-8编码的字节，查表得到进制数字后再转为字符串
+        return digits_to_string(self.bytes_to_digits(text.encode('utf-8')))
+
+    def bytes_to_digits(self, data):
+        """
+        将字节数据转换为当前进制的数字数组
+        :param data: bytes、bytearray、memoryview或np.uint8数组
+        :return: np.uint8数字数组，每个元素为0到base-1的数值
+        """
+        # 带格式头的图片记录了精确的位数，使用定长编码以便无损还原
+        return bytes_to_digits(data, self.base, fixed_width=self.embed_header)
     
-    def create_binary_image(self, binary_string, ignore_pixel_limit=False):
+    def create_binary_image(self, binary_string, ignore_pixel_limit=False, max_width=DEFAULT_MAX_WIDTH):
         """
         根据进制字符串创建图像
-        :param binary_string: 进制字符串
+        :param binary_string: 进制字符串，或bytes_to_digits返回的数字数组
         :param ignore_pixel_limit: 是否忽略像素限制
+        :param max_width: 图片最大宽度，或自动布局 'auto'、'auto:宽:高'，见parse_layout
+        :return: PIL图像对象
+        """
+        digit_count = len(binary_string)
+        columns, rows = self._grid_layout(digit_count, ignore_pixel_limit, max_width)
+        img_width = columns * self.block_width
+        img_height = rows * self.block_height
+
+        if self.embed_header:
+            return self._create_header_image(binary_string, columns, rows)
+        if img_width * img_height == 0:
+            return Image.new(self.image_mode, (img_width, img_height), 'white')
+
+        # 将每个字符映射为调色板下标，再按行列排成网格
+        indices, palette = self.digits_to_palette_indices(binary_string)
+        grid = np.full(rows * columns, len(palette) - 1, dtype=np.uint8)  # 末尾空位为白色背景
+        grid[:digit_count] = indices
+        grid = grid.reshape(rows, columns)
+
+        # 查表得到每个块的像素值，再放大到块尺寸
+        table = self._pixel_table(palette)
+        buffer = self._pixel_buffer((img_height, img_width) + table.shape[1:], table.dtype, rows, columns)
+        try:
+            self._render_blocks(buffer, 0, grid, table)
+            return self._pixels_to_image(buffer, palette)
+        finally:
+            buffer.release()
+
+    def _pixel_table(self, palette):
+        """
+        调色板下标到输出像素值的映射表
+        :param palette: 调色板RGB数组
+        :return: P模式直接使用下标（每像素1字节），1位黑白模式白色为True，RGB模式为调色板本身
+        """
+        if self.image_mode == 'P':
+            return np.arange(len(palette), dtype=np.uint8)
+        if self.image_mode == '1':
+            return _white_entries(palette)
+        return palette
+
+    def _pixel_buffer(self, shape, dtype, rows, columns):
+        """
+        分配输出像素数组。按进程分段渲染时直接分配在共享内存中，各进程写入后无需再复制
+        :param shape: 像素数组形状
+        :param dtype: 像素类型
+        :param rows: 数据区块的行数
+        :param columns: 数据区每行块数
+        :return: SharedArray或LocalArray，用完后调用release
+        """
+        if self.executor == 'process' and len(self._block_bands(rows, columns)) > 1:
+            return SharedArray(shape, dtype)
+        return LocalArray(shape, dtype)
+
+    def _block_bands(self, rows, columns):
+        """
+        数据区渲染时的块行分段，见_band_ranges
+        """
+        return _band_ranges(rows, columns * self.block_width * self.block_height, self.workers)
+
+    def _pixels_to_image(self, buffer, palette):
+        """
+        将_pixel_table映射后的像素数组转换为PIL图像
+        :param buffer: _pixel_buffer返回的像素数组
+        :param palette: 调色板RGB数组，P模式写入图片调色板
         :return: PIL图像对象
         """
+        img = Image.fromarray(buffer.array)
+        if img.readonly and isinstance(buffer, SharedArray):
+            # 图像直接引用了数组内存（如P模式），共享内存释放前复制出来
+            img = img.copy()
+        if self.image_mode == 'P':
+            img.putpalette(palette.ravel().tolist())
+        return img
+
+    def _render_blocks(self, buffer, top, grid, table):
+        """
+        将块网格查表并放大后写入像素数组左上角从top行开始的区域，
+        图片较大时按块行分段在多个线程或进程中并行处理
+        :param buffer: _pixel_buffer返回的像素数组，为SharedArray时在进程中处理
+        :param top: 数据区在像素数组中的起始像素行
+        :param grid: 形状为(块行数, 块列数)的调色板下标数组
+        :param table: _pixel_table返回的映射表
+        """
+        rows, columns = grid.shape
+        bands = self._block_bands(rows, columns)
+
+        if isinstance(buffer, SharedArray):
+            # 网格放在共享内存中，各进程直接写入像素数组中自己的块行
+            shared_grid = SharedArray(grid.shape, grid.dtype)
+            try:
+                shared_grid.array[...] = grid
+                tasks = [(self, buffer.descriptor, top, shared_grid.descriptor, table, start, stop)
+                         for start, stop in bands]
+                _map_in_processes(_render_band_shared, tasks, self.workers)
+            finally:
+                shared_grid.release()
+            return
+
+        target = buffer.array[top:, :columns * self.block_width]
+        _map_bands(lambda start, stop: self._render_band(target, grid, table, start, stop), bands, self.workers)
+
+    def _render_band(self, target, grid, table, start, stop):
+        """
+        渲染一段块行：查表得到每个块的像素值并放大后写入目标数组的对应行
+        """
+        target[start * self.block_height:stop * self.block_height] = self._expand_blocks(table[grid[start:stop]])
+
+    def _create_header_image(self, binary_string, columns, rows):
+        """
+        创建开头带格式头的图像
+        :param binary_string: 进制字符串，或进制数字数组
+        :param columns: 每行块数
+        :param rows: 块的行数
+        :return: PIL图像对象
+        """
+        indices, palette = self.digits_to_palette_indices(binary_string)
+        background = len(palette) - 1
+        img_width, header_rows, img_height = self._header_image_size(columns, rows)
+        body_width = columns * self.block_width
+
+        # 格式头使用黑色（无法识别字符的颜色）和白色背景，宽度不足时右侧补白色背景
+        table = self._pixel_table(palette)
+        buffer = self._pixel_buffer((img_height, img_width) + table.shape[1:], table.dtype, rows, columns)
+        try:
+            buffer.array[:header_rows] = table[self._header_indices(indices, columns, img_width, palette)]
+            buffer.array[header_rows:, body_width:] = table[background]
+            if rows:
+                grid = np.full(rows * columns, background, dtype=np.uint8)
+                grid[:len(indices)] = indices
+                self._render_blocks(buffer, header_rows, grid.reshape(rows, columns), table)
+            return self._pixels_to_image(buffer, palette)
+        finally:
+            buffer.release()
+
+    def _header_image_size(self, columns, rows):
+        """
+        计算带格式头的图片尺寸
+        :param columns: 每行块数
+        :param rows: 块的行数
+        :return: (图片宽度, 格式头行数, 图片高度)
+        """
+        img_width = max(columns * self.block_width, _HEADER_MIN_WIDTH)
+        header_rows = image_header_rows(img_width)
+        return img_width, header_rows, header_rows + rows * self.block_height
+
+    def _header_indices(self, indices, columns, img_width, palette):
+        """
+        生成格式头像素行的调色板下标
+        :param indices: 数字的调色板下标数组
+        :param columns: 每行块数
+        :param img_width: 图片宽度
+        :param palette: 调色板，倒数第二项为黑色、最后一项为白色
+        :return: 形状为(格式头行数, img_width)的np.uint8数组
+        """
+        header = pack_image_header(self.base, self.block_width, self.block_height, columns, indices)
+        return np.where(image_header_bits(header, img_width), len(palette) - 2, len(palette) - 1).astype(np.uint8)
+
+    def _grid_layout(self, digit_count, ignore_pixel_limit=False, max_width=DEFAULT_MAX_WIDTH):
+        """
+        计算块网格的列数和行数，并检查图片是否超过像素限制
+        :param digit_count: 位数
+        :param ignore_pixel_limit: 是否忽略像素限制
+        :param max_width: 图片最大宽度或自动布局，见parse_layout
+        :return: (每行块数, 行数)
+        """
         # 计算图像尺寸
-        max_width = 800  # 默认最大宽度
-        chars_per_row = max_width // self.block_width
-        rows = (len(binary_string) + chars_per_row - 1) // chars_per_row
-        
-        # 创建白色背景图像
-        img_width = min(chars_per_row * self.block_width, len(binary_string) * self.block_width)
+        columns, rows = grid_layout(digit_count, self.block_width, self.block_height, max_width)
+        img_width = columns * self.block_width
         img_height = rows * self.block_height
-        
+        if self.embed_header:
+            img_width, _, img_height = self._header_image_size(columns, rows)
+
         # 安全检查：防止创建过大的图片
-        max_pixels = 50000000  # 50兆像素
+        max_pixels = MAX_PIXELS
         total_pixels = img_width * img_height
         if total_pixels > max_pixels and not ignore_pixel_limit:
             raise ValueError(f"要创建的图片尺寸过大 ({img_width}x{img_height} = {total_pixels} 像素)，可能存在安全风险。请减少文本长度或增加块大小。")
-        
-        img = Image.new('RGB', (img_width, img_height), 'white')
-        draw = ImageDraw.Draw(img)
-        
-        # 获取当前进制的颜色映射
-        colors = self.base_colors.get(self.base, self.base_colors[2])
-        
-        # 绘制每个字符
-        for i, char in enumerate(binary_string):
-            row = i // chars_per_row
-            col = i % chars_per_row
-            
-            x = col * self.block_width
-            y = row * self.block_height
-            
-            # 根据字符选择颜色
-            color = colors.get(char.upper(), 'black')  # 默认黑色
-            
-            # 绘制矩形
-            draw.rectangle([x, y, x + self.block_width - 1, y + self.block_height - 1], fill=color)
-        
-        return img
+
+        return columns, rows
+
+    def write_png_streaming(self, binary_string, output_path, ignore_pixel_limit=False, max_width=DEFAULT_MAX_WIDTH,
+                            metadata=None):
+        """
+        逐块行生成像素并增量压缩写入PNG文件，完整图像不会出现在内存中，
+        峰值内存只与图片宽度有关。输出与create_binary_image逐像素一致
+        :param binary_string: 进制字符串，或进制数字数组
+        :param output_path: 输出PNG文件路径
+        :param ignore_pixel_limit: 是否忽略像素限制
+        :param max_width: 图片最大宽度或自动布局，见parse_layout
+        :param metadata: 写入PNG文本块的编码参数，见png_metadata，为None时不写入
+        """
+        digit_count = len(binary_string)
+        columns, rows = self._grid_layout(digit_count, ignore_pixel_limit, max_width)
+        img_width = columns * self.block_width
+        img_height = rows * self.block_height
+        header_rows = 0
+        if self.embed_header:
+            img_width, header_rows, img_height = self._header_image_size(columns, rows)
+        if columns * rows == 0 or img_width != columns * self.block_width:
+            # 空图片，或宽度不足格式头最小宽度的小图片
+            img = self.create_binary_image(binary_string, ignore_pixel_limit, max_width)
+            if metadata is None:
+                img.save(output_path)
+            else:
+                img.save(output_path, pnginfo=png_info(metadata))
+            return
+
+        indices, palette = self.digits_to_palette_indices(binary_string)
+        background = len(palette) - 1
+
+        # 各输出模式对应的PNG颜色类型、位深度和调色板
+        if self.image_mode == 'P':
+            png_format = {'color_type': 3, 'bit_depth': 8, 'palette': palette}
+        elif self.image_mode == '1':
+            png_format = {'color_type': 0, 'bit_depth': 1}
+            white_entries = _white_entries(palette)
+        else:
+            png_format = {'color_type': 2, 'bit_depth': 8}
+        if metadata is not None:
+            png_format['text'] = png_text_chunks(metadata)
+
+        with PNGStreamWriter(output_path, img_width, img_height, **png_format) as writer:
+            if header_rows:
+                header = self._header_indices(indices, columns, img_width, palette)
+                if self.image_mode == 'P':
+                    writer.write_rows(header)
+                elif self.image_mode == '1':
+                    writer.write_rows(np.packbits(white_entries[header], axis=1))
+                else:
+                    writer.write_rows(palette[header].reshape(header_rows, -1))
+
+            for start in range(0, rows, _STREAM_BLOCK_ROWS):
+                batch = min(_STREAM_BLOCK_ROWS, rows - start)
+                grid = np.full(batch * columns, background, dtype=np.uint8)
+                chunk = indices[start * columns:(start + batch) * columns]
+                grid[:len(chunk)] = chunk
+                grid = grid.reshape(batch, columns)
+
+                # 生成每个块行的第一条扫描线
+                if self.image_mode == 'P':
+                    first_lines = np.repeat(grid, self.block_width, axis=1)
+                elif self.image_mode == '1':
+                    first_lines = np.packbits(np.repeat(white_entries[grid], self.block_width, axis=1), axis=1)
+                else:
+                    first_lines = np.repeat(palette[grid], self.block_width, axis=1).reshape(batch, -1)
+
+                # 每个块行的第一条扫描线不做滤波，其余扫描线与上一行完全相同，
+                # 使用Up滤波后全为0，压缩几乎没有开销
+                scanlines = np.zeros((batch, self.block_height, 1 + first_lines.shape[1]), dtype=np.uint8)
+                scanlines[:, 0, 1:] = first_lines
+                scanlines[:, 1:, 0] = PNG_FILTER_UP
+                writer.write_scanlines(scanlines)
+
+    def digits_to_palette_indices(self, binary_string):
+        """
+        将进制字符串或数字数组映射为调色板下标
+        :param binary_string: 进制字符串，或进制数字数组
+        :return: (np.uint8下标数组, 调色板RGB数组)。调色板依次为当前进制各字符的颜色、
+                 无法识别字符使用的黑色、背景白色
+        """
+        # 当前进制的调色板，各字符颜色之后是无法识别字符使用的黑色和背景白色
+        codec = get_codec(self.base)
+        palette = codec.palette
+        fallback_index = len(codec.colors)
+
+        if isinstance(binary_string, np.ndarray):
+            digits = binary_string.astype(np.uint8, copy=False)
+        else:
+            digits = string_to_digits(binary_string)
+
+        # 超出当前进制颜色映射的字符视为无法识别
+        indices = np.where(digits < fallback_index, digits, fallback_index).astype(np.uint8)
+        return indices, palette
+
+    def _expand_blocks(self, grid):
+        """
+        将每个块一个元素的网格放大为每个块block_width x block_height个像素
+        :param grid: 形状为(行数, 列数, ...)的数组
+        :return: 形状为(行数*block_height, 列数*block_width, ...)的连续数组
+        """
+        rows, columns = grid.shape[:2]
+        extra = grid.shape[2:]
+        expanded = np.broadcast_to(
+            grid[:, None, :, None],
+            (rows, self.block_height, columns, self.block_width) + extra
+        )
+        return expanded.reshape((rows * self.block_height, columns * self.block_width) + extra)
     
-    def encrypt_to_image(self, text, output_path, max_width=800, ignore_pixel_limit=False):
+    def _resolve_output_path(self, output_path):
         """
-        将文本加密为图片
-        :param text: 要加密的文本
+        确定实际保存路径：相对路径放入"生成的图片"目录，文件已存在时自动添加序号
         :param output_path: 输出图片路径
-        :param max_width: 图片最大宽度，超过时会自动换行
-        :param ignore_pixel_limit: 是否忽略像素限制
-        :return: 二进制字符串, 实际保存路径
+        :return: 实际保存路径
         """
         # 确保生成的图片目录存在
         output_dir = os.path.join(os.getcwd(), "生成的图片")
@@ -299,231 +1689,253 @@ class TextToImageEncryptor:
             actual_output_path = f"{base_name}_{counter}{ext}"
             counter += 1
         
-        # 将文本转换为进制字符串
-        base_string = self.text_to_binary(text)
-        print(f"进制({self.base})表示: {base_string}")
-        print(f"原始文本: {text}")
+        return actual_output_path
+    
+    def encrypt_to_image(self, text, output_path, max_width=DEFAULT_MAX_WIDTH, ignore_pixel_limit=False, streaming=False):
+        """
+        将文本加密为图片
+        :param text: 要加密的文本
+        :param output_path: 输出图片路径
+        :param max_width: 图片最大宽度，超过时会自动换行；'auto' 生成接近正方形的图片，
+                          'auto:宽:高' 生成接近指定宽高比的图片
+        :param ignore_pixel_limit: 是否忽略像素限制
+        :param streaming: 是否逐行流式写入PNG（仅.png路径），大图片时显著降低内存占用
+        :return: 二进制字符串, 实际保存路径
+        """
+        actual_output_path = self._resolve_output_path(output_path)
         
-        # 创建图像
-        img = self.create_binary_image(base_string, ignore_pixel_limit)
+        # 将文本转换为进制数字
+        digits = self.bytes_to_digits(text.encode('utf-8'))
+        base_string = digits_to_string(digits)
+        print(f"进制({self.base})表示: {base_string[:50]}..." if len(base_string) > 50 else f"进制({self.base})表示: {base_string}")
+        print(f"原始文本: {text[:50]}..." if len(text) > 50 else f"原始文本: {text}")
         
-        # 保存图像
-        img.save(actual_output_path)
+        # 创建并保存图像
+        self._save_digits_image(digits, actual_output_path, ignore_pixel_limit, streaming, max_width,
+                                self.png_metadata(len(digits), max_width, payload='text'))
         print(f"加密完成! 图像已保存到: {actual_output_path}")
         
         return base_string, actual_output_path
+    
+    def _save_digits_image(self, digits, output_path, ignore_pixel_limit=False, streaming=False,
+                           max_width=DEFAULT_MAX_WIDTH, metadata=None):
+        """
+        将进制数字渲染并保存为图片
+        :param digits: 进制数字数组
+        :param output_path: 输出图片路径
+        :param ignore_pixel_limit: 是否忽略像素限制
+        :param streaming: 是否逐行流式写入PNG，非PNG路径时忽略
+        :param max_width: 图片最大宽度或自动布局，见parse_layout
+        :param metadata: 编码参数，保存为PNG时写入文本块，见png_metadata
+        """
+        is_png = output_path.lower().endswith('.png')
+        if not is_png:
+            metadata = None
+        if streaming and is_png:
+            self.write_png_streaming(digits, output_path, ignore_pixel_limit, max_width, metadata)
+        elif metadata is not None:
+            self.create_binary_image(digits, ignore_pixel_limit, max_width).save(output_path, pnginfo=png_info(metadata))
+        else:
+            self.create_binary_image(digits, ignore_pixel_limit, max_width).save(output_path)
+    
+    def png_metadata(self, digit_count, max_width=DEFAULT_MAX_WIDTH, payload='text', **extra):
+        """
+        生成写入PNG文本块的编码参数，解密和检查图片时只需读取文件头即可得到
+        :param digit_count: 图片中的位数
+        :param max_width: 图片最大宽度或自动布局，见parse_layout
+        :param payload: 载荷类型，'text' 或 'file'
+        :param extra: 其他参数，如文件名、分块或分片序号
+        :return: 编码参数字典
+        """
+        columns, rows = grid_layout(digit_count, self.block_width, self.block_height, max_width)
+        metadata = {
+            'version': PNG_METADATA_VERSION,
+            'payload': payload,
+            'base': self.base,
+            'block_width': self.block_width,
+            'block_height': self.block_height,
+            'columns': columns,
+            'rows': rows,
+            'digits': digit_count,
+            'layout': str(max_width),
+            'image_mode': self.image_mode,
+            'header': int(self.embed_header),
+            # 文件容器和带格式头的图片使用定长编码
+            'fixed_width': int(self.embed_header or payload == 'file'),
+        }
+        metadata.update(extra)
+        return metadata
+    
+    def encrypt_to_shards(self, text, output_path, max_shard_pixels=MAX_PIXELS, max_width=DEFAULT_MAX_WIDTH):
+        """
+        将文本加密为多张分片图片，每张图片不超过指定像素数，并生成分片清单
+        :param text: 要加密的文本
+        :param output_path: 输出图片路径，分片保存为 名称_shard0001.png 等，清单保存为 名称.manifest.json
+        :param max_shard_pixels: 每张分片图片的最大像素数
+        :param max_width: 图片最大宽度或自动布局，见parse_layout
+        :return: (进制字符串, 清单路径, 分片图片路径列表)
+        """
+        digits = self.bytes_to_digits(text.encode('utf-8'))
+        manifest_path, shard_paths = self.save_digits_as_shards(digits, output_path, max_shard_pixels, payload='text',
+                                                                max_width=max_width)
+        return digits_to_string(digits), manifest_path, shard_paths
+    
+    def digit_capacity(self, max_pixels=MAX_PIXELS, max_width=DEFAULT_MAX_WIDTH):
+        """
+        计算单张图片在像素上限内可以容纳的最大位数
+        :param max_pixels: 像素上限
+        :param max_width: 图片最大宽度或自动布局，与create_binary_image的布局一致
+        :return: 位数
+        """
+        capacity = grid_capacity(max_pixels, self.block_width, self.block_height, max_width)
+        if not self.embed_header or capacity == 0:
+            return capacity
+        
+        # 扣除格式头占用的像素行。自动布局时扣除后宽度可能略微变窄，多预留一行
+        columns, _ = grid_layout(capacity, self.block_width, self.block_height, max_width)
+        img_width = max(columns * self.block_width, _HEADER_MIN_WIDTH)
+        header_pixels = (image_header_rows(img_width) + 1) * img_width
+        return grid_capacity(max(max_pixels - header_pixels, 0), self.block_width, self.block_height, max_width)
+    
+    def save_digits_as_shards(self, digits, output_path, max_shard_pixels=MAX_PIXELS, payload='text',
+                              max_width=DEFAULT_MAX_WIDTH, metadata=None):
+        """
+        将进制数字按图片容量切分，依次生成分片图片并写出分片清单。
+        除最后一张外每张分片都被填满，因此没有清单时按顺序拼接也能还原
+        :param digits: 进制数字数组
+        :param output_path: 输出图片路径
+        :param max_shard_pixels: 每张分片图片的最大像素数
+        :param payload: 载荷类型，'text' 或 'file'
+        :param max_width: 图片最大宽度或自动布局，见parse_layout
+        :param metadata: 写入每张分片PNG文本块的其他参数，如文件名
+        :return: (清单路径, 分片图片路径列表)
+        """
+        capacity = self.digit_capacity(max_shard_pixels, max_width)
+        if capacity == 0:
+            raise ValueError(f"分片像素上限 {max_shard_pixels} 过小，无法容纳一行 {self.block_width}x{self.block_height} 的块")
+        
+        base_name, ext = os.path.splitext(output_path)
+        shard_count = max(1, (len(digits) + capacity - 1) // capacity)
+        shard_entries = []
+        shard_paths = []
+        for index, start in enumerate(range(0, max(len(digits), 1), capacity)):
+            shard = digits[start:start + capacity]
+            
+            # 分片尺寸已由max_shard_pixels限定
+            shard_path = self._resolve_output_path(f"{base_name}_shard{index + 1:04d}{ext}")
+            shard_metadata = self.png_metadata(len(shard), max_width, payload, shard_index=index,
+                                               shard_count=shard_count, **(metadata or {}))
+            self._save_digits_image(shard, shard_path, ignore_pixel_limit=True, max_width=max_width,
+                                    metadata=shard_metadata)
+            
+            shard_paths.append(shard_path)
+            shard_entries.append({
+                'index': index,
+                'file': os.path.basename(shard_path),
+                'digits': len(shard),
+                'crc32': zlib.crc32(shard.tobytes())
+            })
+            print(f"分片 {index + 1} 已保存到: {shard_path}")
+        
+        manifest = {
+            'version': SHARD_MANIFEST_VERSION,
+            'payload': payload,
+            'base': self.base,
+            'block_width': self.block_width,
+            'block_height': self.block_height,
+            'total_digits': len(digits),
+            'shards': shard_entries
+        }
+        manifest_path = self._resolve_output_path(f"{base_name}.manifest.json")
+        with open(manifest_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=2)
+        print(f"分片清单已保存到: {manifest_path}")
+        
+        return manifest_path, shard_paths
 
 
 class ImageToTextDecryptor:
-    def __init__(self, block_width=9, block_height=16, base=None, ignore_pixel_limit=False):
+    def __init__(self, block_width=9, block_height=16, base=None, ignore_pixel_limit=False, sampler='center',
+                 workers=1, executor='thread'):
         """
         初始化解密器
-        :param block_width: 每个位的宽度（像素）
-        :param block_height: 每个位的高度（像素）
+        :param block_width: 每个位的宽度（像素），为'auto'时从像素数据中检测
+        :param block_height: 每个位的高度（像素），为'auto'时从像素数据中检测
         :param base: 进制，支持2-16，如果为None则自动识别
         :param ignore_pixel_limit: 是否忽略像素限制
+        :param sampler: 块采样方式，见SAMPLERS，默认只读取块中心像素
+        :param workers: 识别颜色时使用的线程数，大图片按块行分段并行处理；为None时使用全部CPU核心
+        :param executor: 分段并行的方式，见EXECUTORS；process在进程池中识别，像素通过共享内存传递
         """
+        if sampler not in SAMPLERS:
+            raise ValueError(f"不支持的采样方式: {sampler}，可选: {', '.join(SAMPLERS)}")
+        if executor not in EXECUTORS:
+            raise ValueError(f"不支持的并行方式: {executor}，可选: {', '.join(EXECUTORS)}")
+        self.sampler = sampler
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+        # 自动检测的块尺寸在每张不带格式头的图片上重新检测
+        self.auto_block_width = block_width == BLOCK_SIZE_AUTO
+        self.auto_block_height = block_height == BLOCK_SIZE_AUTO
         self.block_width = block_width
         self.block_height = block_height
         self.base = base
         self.ignore_pixel_limit = ignore_pixel_limit
-        
-        # 定义不同进制的颜色映射
-        self.base_colors = {
-            2: {  # 二进制
-                '0': 'white',
-                '1': 'black'
-            },
-            3: {  # 三进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'red'
-            },
-            4: {  # 四进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'red'
-            },
-            5: {  # 五进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'yellow',
-                '4': 'red'
-            },
-            6: {  # 六进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'red'
-            },
-            7: {  # 七进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'red'
-            },
-            8: {  # 八进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'red'
-            },
-            9: {  # 九进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'red'
-            },
-            10: {  # 十进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'red'
-            },
-            11: {  # 十一进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'brown',
-                'A': 'red'
-            },
-            12: {  # 十二进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'brown',
-                'A': 'red',
-                'B': 'darkred'
-            },
-            13: {  # 十三进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'brown',
-                'A': 'red',
-                'B': 'darkred',
-                'C': 'maroon'
-            },
-            14: {  # 十四进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'brown',
-                'A': 'red',
-                'B': 'darkred',
-                'C': 'maroon',
-                'D': 'crimson'
-            },
-            15: {  # 十五进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'brown',
-                'A': 'red',
-                'B': 'darkred',
-                'C': 'maroon',
-                'D': 'crimson',
-                'E': 'firebrick'
-            },
-            16: {  # 十六进制
-                '0': 'white',
-                '1': 'blue',
-                '2': 'green',
-                '3': 'cyan',
-                '4': 'yellow',
-                '5': 'magenta',
-                '6': 'orange',
-                '7': 'purple',
-                '8': 'pink',
-                '9': 'brown',
-                'A': 'red',
-                'B': 'darkred',
-                'C': 'maroon',
-                'D': 'crimson',
-                'E': 'firebrick',
-                'F': 'black'
-            }
-        }
-        
-        # 创建反向颜色映射，用于自动识别进制
-        self.color_to_base = {}
-        for base, colors in self.base_colors.items():
-            for char, color in colors.items():
-                if color not in self.color_to_base:
-                    self.color_to_base[color] = set()
-                self.color_to_base[color].add(base)
-        
+        # 最近一次解密的图片是否使用定长编码（带格式头），以及是否按记录的位数精确提取（白色为数字0）
+        self.fixed_width = False
+        self.exact_digits = False
+        # 最近一次保留白色块提取旧格式图片时，各位是否为白色背景；其他情况为None
+        self.background_mask = None
+
     def extract_binary_from_image(self, img_path):
         """
         从图片中提取进制数据
         :param img_path: 图片路径
         :return: (进制字符串, 识别出的进制)
         """
+        digits, base = self.extract_digits_from_image(img_path)
+        return digits_to_string(digits), base
+
+    def extract_digits_from_image(self, img_path, keep_background=False):
+        """
+        从图片中提取进制数字数组
+        :param img_path: 图片路径
+        :param keep_background: 是否保留白色块。默认与文本解密一致忽略白色背景；
+                                保留时白色按数字0处理，用于定长编码的原生文件容器
+        :return: (np.uint8数字数组, 识别出的进制)
+        """
         # 打开图片
         img = Image.open(img_path)
-        img = img.convert('RGB')
         
         # 获取图片尺寸
         img_width, img_height = img.size
         
         # 安全检查：防止处理过大的图片
-        max_pixels = 50000000  # 50兆像素
+        max_pixels = MAX_PIXELS
         total_pixels = img_width * img_height
         if total_pixels > max_pixels and not self.ignore_pixel_limit:
             raise ValueError(f"图片尺寸过大 ({img_width}x{img_height} = {total_pixels} 像素)，可能存在安全风险。请使用小于 {max_pixels} 像素的图片。")
         
+        # PNG文本块记录了编码参数时，读取文件头即可得知图片是否带格式头
+        metadata = read_png_metadata(img)
+        
+        # 带格式头的图片直接按格式头配置进制和块尺寸
+        header = None
+        if metadata is None or metadata.get('header'):
+            header = read_image_header(img)
+        self.fixed_width = header is not None
+        self.exact_digits = header is not None or metadata is not None
+        self.background_mask = None
+        if header is not None:
+            return self._extract_header_digits(img, header), self.base
+        if metadata is not None:
+            return self._extract_metadata_digits(img, metadata), self.base
+        
+        # 旧格式图片：按需从像素数据中检测块尺寸，并裁掉网格之前的像素
+        if self.auto_block_width or self.auto_block_height:
+            img = self._detect_block_size(img)
+            img_width, img_height = img.size
+        
         # 计算每行可以容纳的字符数
         chars_per_row = img_width // self.block_width
         
@@ -535,43 +1947,29 @@ class ImageToTextDecryptor:
         print(f"块尺寸: {self.block_width}x{self.block_height}")
         print(f"每行字符数: {chars_per_row}")
         print(f"总行数: {rows}")
+
+        # 一次性取出所有块中心像素并识别颜色，自动识别进制与提取数字共用这一次识别结果
+        color_ids, preview_rgb = self._classify_block_centers(img, rows, chars_per_row)
         
         # 如果没有指定进制，则自动识别
         if self.base is None:
-            # 收集图像中出现的所有颜色
-            colors_in_image = set()
-            rgb_values = []  # 用于调试
-            
-            # 遍历图像中的每个块
-            for row in range(rows):
-                for col in range(chars_per_row):
-                    x = col * self.block_width + self.block_width // 2
-                    y = row * self.block_height + self.block_height // 2
-                    
-                    # 确保坐标在图像范围内
-                    if x < img_width and y < img_height:
-                        # 获取像素颜色
-                        r, g, b = img.getpixel((x, y))
-                        rgb_values.append((r, g, b))  # 用于调试
-                        
-                        # 简化颜色判断，将RGB值转换为颜色名称
-                        color = self._rgb_to_color_name(r, g, b)
-                        # 忽略白色背景
-                        if color != 'white':
-                            colors_in_image.add(color)
+            # 收集图像中出现的所有颜色，忽略白色背景
+            color_counts = np.bincount(color_ids, minlength=len(_REFERENCE_COLOR_NAMES))
+            colors_in_image = {_REFERENCE_COLOR_NAMES[i] for i in np.flatnonzero(color_counts)}
+            colors_in_image.discard('white')
             
             # 调试信息
             print(f"识别到的颜色: {colors_in_image}")
-            print(f"前10个RGB值: {rgb_values[:10]}")
-            print(f"颜色到进制映射: {self.color_to_base}")
+            print(f"前10个RGB值: {[tuple(int(v) for v in rgb) for rgb in preview_rgb]}")
+            print(f"颜色到进制映射: {dict(_bases_by_color())}")
             
             # 根据颜色识别进制
             possible_bases = set()  # 初始化为空集合
             
             for color in colors_in_image:
-                if color in self.color_to_base:
-                    possible_bases.update(self.color_to_base[color])
-                    print(f"颜色 '{color}' 对应的进制: {self.color_to_base[color]}")
+                if color in _bases_by_color():
+                    possible_bases.update(_bases_by_color()[color])
+                    print(f"颜色 '{color}' 对应的进制: {set(_bases_by_color()[color])}")
                 else:
                     print(f"警告: 颜色 '{color}' 不在颜色到进制映射中")
             
@@ -586,42 +1984,225 @@ class ImageToTextDecryptor:
                 self.base = 2
                 print("无法识别进制，默认使用二进制")
         
-        # 获取当前进制的颜色映射
-        colors = self.base_colors.get(self.base, self.base_colors[2])
+        # 按颜色编号查表得到数字，白色背景被忽略，
+        # 不属于当前进制的颜色按最接近颜色处理，找不到时记为0
+        digit_table = self._color_digit_table(keep_background)
+        digits = digit_table[color_ids]
+        if keep_background:
+            # 白色与无法识别的颜色都记为0，按颜色编号记下背景，以便还原为忽略背景时的结果
+            self.background_mask = color_ids == _WHITE_ID
+            return digits, self.base
+        return digits[digits != _SKIP_DIGIT], self.base
+
+    def _detect_block_size(self, img):
+        """
+        检测旧格式图片的块网格，更新设为自动的块尺寸
+        :param img: PIL图像对象
+        :return: 从网格起点裁剪后的PIL图像对象
+        """
+        # 调色板、黑白和灰度图片直接在索引数组上检测，索引不同即颜色不同
+        if img.mode not in ('P', '1', 'L', 'RGB'):
+            img = img.convert('RGB')
+        block_width, offset_x, block_height, offset_y = detect_block_grid(np.asarray(img))
+        
+        if not self.auto_block_width:
+            offset_x = 0
+        else:
+            self.block_width = block_width
+        if not self.auto_block_height:
+            offset_y = 0
+        else:
+            self.block_height = block_height
+        print(f"检测到的块尺寸: {self.block_width}x{self.block_height}，偏移: ({offset_x}, {offset_y})")
+        
+        if offset_x or offset_y:
+            img = img.crop((offset_x, offset_y, img.size[0], img.size[1]))
+        return img
+
+    def _extract_header_digits(self, img, header):
+        """
+        按格式头从图片中精确提取数字：白色按数字0处理，只读取有数据的块行，并校验CRC。
+        使用mean/median采样（用于有损压缩的图片）时校验失败只给出警告，返回尽力识别的结果
+        :param img: PIL图像对象
+        :param header: ImageHeader
+        :return: np.uint8数字数组
+        """
+        self.base = header.base
+        self.block_width = header.block_width
+        self.block_height = header.block_height
+        
+        print(f"图片格式头: 进制 {header.base}，块尺寸 {header.block_width}x{header.block_height}，"
+              f"每行 {header.columns} 位，共 {header.digit_count} 位")
+        if header.digit_count == 0:
+            return np.zeros(0, dtype=np.uint8)
+        
+        rows = (header.digit_count + header.columns - 1) // header.columns
+        top = image_header_rows(img.size[0])
+        body = img.crop((0, top, header.columns * header.block_width, top + rows * header.block_height))
+        color_ids, _ = self._classify_block_centers(body, rows, header.columns)
+        digits = self._color_digit_table(keep_background=True)[color_ids][:header.digit_count]
+        
+        if zlib.crc32(digits.tobytes()) != header.crc32:
+            if self.sampler == 'center':
+                raise ValueError("图片数据校验失败，图片可能已损坏或经过有损压缩；有损压缩的图片可使用mean或median采样")
+            print("警告: 图片数据校验失败，部分数字可能识别错误，返回尽力识别的结果")
+        return digits
+
+    def _extract_metadata_digits(self, img, metadata):
+        """
+        按PNG文本块中的编码参数从不带格式头的图片中精确提取数字，无需自动识别进制
+        :param img: PIL图像对象
+        :param metadata: read_png_metadata返回的编码参数
+        :return: np.uint8数字数组
+        """
+        self.base = metadata['base']
+        self.block_width = metadata['block_width']
+        self.block_height = metadata['block_height']
+        self.fixed_width = bool(metadata.get('fixed_width'))
+        
+        print(f"图片编码参数: 进制 {self.base}，块尺寸 {self.block_width}x{self.block_height}，"
+              f"每行 {metadata['columns']} 位，共 {metadata['digits']} 位")
+        if metadata.get('header'):
+            # 文本块记录了格式头但格式头无法读取（如开头几行已损坏），跳过格式头所在的像素行
+            print("警告: 无法读取图片格式头，按PNG文本块中的编码参数解码，无法校验CRC")
+            top = image_header_rows(img.size[0])
+            img = img.crop((0, top, metadata['columns'] * self.block_width,
+                            top + metadata['rows'] * self.block_height))
+        color_ids, _ = self._classify_block_centers(img, metadata['rows'], metadata['columns'])
+        return self._color_digit_table(keep_background=True)[color_ids][:metadata['digits']]
+
+    def _classify_block_centers(self, img, rows, chars_per_row):
+        """
+        识别每个块中心像素（或块内部窗口）的颜色。调色板、黑白和灰度图片直接读取原始索引，
+        只需对调色板中的每一项识别一次颜色，无需逐像素比较。图片较大且workers大于1时，
+        按块行分段在多个线程中并行采样和识别，再按顺序拼接
+        :param img: PIL图像对象
+        :param rows: 块的行数
+        :param chars_per_row: 每行块数
+        :return: (颜色编号数组, 前10个块中心像素的RGB值)
+        """
+        if img.mode in ('P', '1', 'L'):
+            entry_rgb = _index_palette_rgb(img)
+            entry_ids = self._classify_pixels(entry_rgb)
+        else:
+            entry_rgb = entry_ids = None
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+        pixels = np.asarray(img)
+        if pixels.dtype == bool:
+            # 1位黑白图片的布尔数组转为0/1下标
+            pixels = pixels.astype(np.uint8)
+        
+        def classify(start, stop):
+            band = pixels[start * self.block_height:stop * self.block_height]
+            return self._classify_band(band, stop - start, chars_per_row, entry_rgb, entry_ids)
+        
+        row_pixels = chars_per_row * self.block_width * self.block_height
+        bands = _band_ranges(rows, row_pixels, self.workers)
+        if self.executor == 'process' and len(bands) > 1:
+            return self._classify_in_processes(pixels, bands, chars_per_row, entry_rgb, entry_ids)
+        results = _map_bands(classify, bands, self.workers)
+        if len(results) == 1:
+            return results[0][0], results[0][1][:10]
+        return np.concatenate([ids for ids, _ in results]), np.concatenate([rgb for _, rgb in results])[:10]
+
+    def _classify_in_processes(self, pixels, bands, chars_per_row, entry_rgb, entry_ids):
+        """
+        在进程池中分段识别颜色：像素复制到共享内存一次，各进程把颜色编号直接写入共享的结果数组
+        :param pixels: 像素数组
+        :param bands: _band_ranges返回的分段
+        :param chars_per_row: 每行块数
+        :param entry_rgb: 索引图片的调色板RGB数组，RGB图片为None
+        :param entry_ids: 调色板各项的颜色编号，RGB图片为None
+        :return: (颜色编号数组, 前10个采样的RGB值)
+        """
+        rows = bands[-1][1]
+        shared_pixels = SharedArray(pixels.shape, pixels.dtype)
+        shared_ids = SharedArray((rows * chars_per_row,), np.uint8)
+        try:
+            shared_pixels.array[...] = pixels
+            tasks = [(self, shared_pixels.descriptor, shared_ids.descriptor, chars_per_row, entry_rgb, entry_ids,
+                      start, stop) for start, stop in bands]
+            previews = _map_in_processes(_classify_band_shared, tasks, self.workers)
+            return shared_ids.array.copy(), np.concatenate(previews)[:10]
+        finally:
+            shared_pixels.release()
+            shared_ids.release()
+
+    def _classify_band(self, pixels, rows, chars_per_row, entry_rgb=None, entry_ids=None):
+        """
+        采样并识别一段块行
+        :param pixels: 这段块行的像素数组，RGB图片为(高, 宽, 3)，索引图片为(高, 宽)
+        :param rows: 这段的块行数
+        :param chars_per_row: 每行块数
+        :param entry_rgb: 索引图片的调色板RGB数组，RGB图片为None
+        :param entry_ids: 调色板各项的颜色编号，RGB图片为None
+        :return: (颜色编号数组, 前10个采样的RGB值)
+        """
+        if self.sampler != 'center':
+            samples = self._sample_block_windows(pixels, rows, chars_per_row, entry_rgb)
+            return self._classify_pixels(samples), samples[:10]
+        
+        if entry_rgb is not None:
+            samples = self._sample_block_centers(pixels, rows, chars_per_row).ravel()
+            return entry_ids[samples], entry_rgb[samples[:10]]
         
-        # 创建反向颜色映射（颜色到字符）
-        color_to_char = {color: char for char, color in colors.items()}
+        samples = self._sample_block_centers(pixels, rows, chars_per_row).reshape(-1, 3)
+        return self._classify_pixels(samples), samples[:10]
+
+    def _sample_block_centers(self, pixels, rows, chars_per_row):
+        """
+        以步长切片取出每个块中心的像素
+        :param pixels: 形状为(高, 宽, 3)的RGB像素数组，或形状为(高, 宽)的索引数组
+        :param rows: 块的行数
+        :param chars_per_row: 每行块数
+        :return: 形状为(rows, chars_per_row, 3)的像素数组
+        """
+        return pixels[
+            self.block_height // 2:rows * self.block_height:self.block_height,
+            self.block_width // 2:chars_per_row * self.block_width:self.block_width
+        ]
+
+    def _sample_block_windows(self, pixels, rows, chars_per_row, entry_rgb=None):
+        """
+        对所有块内部窗口的像素整体变形后一次求平均值或中位数
+        :param pixels: 形状为(高, 宽, 3)的RGB像素数组，或形状为(高, 宽)的索引数组
+        :param rows: 块的行数
+        :param chars_per_row: 每行块数
+        :param entry_rgb: 索引数组对应的调色板RGB数组，RGB像素数组为None
+        :return: 形状为(rows * chars_per_row, 3)的np.uint8 RGB数组
+        """
+        bw, bh = self.block_width, self.block_height
+        x0, y0 = bw // _SAMPLE_MARGIN, bh // _SAMPLE_MARGIN
         
-        # 提取进制字符串
-        base_string = ""
+        # (块行, 块内行, 块列, 块内列)，再只保留块内部的窗口
+        blocks = pixels[:rows * bh, :chars_per_row * bw].reshape(rows, bh, chars_per_row, bw, *pixels.shape[2:])
+        windows = blocks[:, y0:bh - y0, :, x0:bw - x0]
+        if entry_rgb is not None:
+            windows = entry_rgb[windows]
         
-        # 遍历图像中的每个块
-        for row in range(rows):
-            for col in range(chars_per_row):
-                x = col * self.block_width + self.block_width // 2
-                y = row * self.block_height + self.block_height // 2
-                
-                # 确保坐标在图像范围内
-                if x < img_width and y < img_height:
-                    # 获取像素颜色
-                    r, g, b = img.getpixel((x, y))
-                    
-                    # 简化颜色判断，将RGB值转换为颜色名称
-                    color = self._rgb_to_color_name(r, g, b)
-                    
-                    # 忽略白色背景
-                    if color == 'white':
-                        continue
-                    
-                    # 根据颜色获取字符
-                    if color in color_to_char:
-                        base_string += color_to_char[color]
-                    else:
-                        # 如果颜色不匹配，尝试找到最接近的颜色
-                        closest_char = self._find_closest_color(r, g, b, colors)
-                        base_string += closest_char
-        
-        return base_string, self.base
+        if self.sampler == 'median':
+            samples = np.median(windows, axis=(1, 3))
+        else:
+            samples = windows.mean(axis=(1, 3), dtype=np.float32)
+        return np.rint(samples).astype(np.uint8).reshape(-1, 3)
+
+    def _classify_pixels(self, samples):
+        """
+        将一组RGB值批量识别为参考颜色编号
+        :param samples: 形状为(N, 3)的RGB数组
+        :return: 形状为(N,)的颜色编号数组，对应_REFERENCE_COLOR_NAMES中的下标
+        """
+        return classify_colors(samples)
+
+    def _color_digit_table(self, keep_background=False):
+        """
+        构造颜色编号到当前进制数字的映射表
+        :param keep_background: 是否将白色按数字0处理
+        :return: 长度为参考颜色数的np.uint8数组，不保留背景时白色为_SKIP_DIGIT
+        """
+        codec = get_codec(self.base)
+        return codec.color_digits_with_background if keep_background else codec.color_digits
     
     def _rgb_to_color_name(self, r, g, b):
         """
@@ -631,41 +2212,8 @@ class ImageToTextDecryptor:
         :param b: 蓝色值
         :return: 颜色名称
         """
-        # 定义一些常见颜色的RGB值
-        color_thresholds = {
-            'white': (245, 245, 245),
-            'black': (10, 10, 10),
-            'blue': (0, 0, 200),
-            'red': (200, 0, 0),
-            'green': (0, 200, 0),
-            'yellow': (200, 200, 0),
-            'cyan': (0, 200, 200),
-            'magenta': (200, 0, 200),
-            'orange': (255, 165, 0),
-            'purple': (128, 0, 128),
-            'pink': (255, 192, 203),
-            'brown': (165, 42, 42),
-            'darkred': (139, 0, 0),
-            'maroon': (128, 0, 0),
-            'crimson': (220, 20, 60),
-            'firebrick': (178, 34, 34)
-        }
-        
-        # 计算与每种颜色的距离
-        min_distance = float('inf')
-        closest_color = 'white'  # 默认白色
-        
-        for color_name, (cr, cg, cb) in color_thresholds.items():
-            distance = ((r - cr) ** 2 + (g - cg) ** 2 + (b - cb) ** 2) ** 0.5
-            if distance < min_distance:
-                min_distance = distance
-                closest_color = color_name
-        
-        # 如果距离太大，可能是白色背景
-        if min_distance > 100:
-            return 'white'
-        
-        return closest_color
+        color_id = self._classify_pixels(np.array([[r, g, b]]))[0]
+        return _REFERENCE_COLOR_NAMES[color_id]
     
     def _find_closest_color(self, r, g, b, colors):
         """
@@ -690,56 +2238,36 @@ class ImageToTextDecryptor:
     def binary_to_text(self, base_string):
         """
         将进制字符串转换为文本
-        :param base_string: 进制字符串
+        :param base_string: 进制字符串，或进制数字数组
         :return: 解密后的文本
         """
+        return bytes_to_text(self.digits_to_bytes(base_string))
+
+    def digits_to_bytes(self, base_string):
+        """
+        将进制字符串或数字数组按每两位一个字节转换为字节数据，带格式头的图片按定长编码转换
+        :param base_string: 进制字符串，或进制数字数组
+        :return: bytes对象，不完整的末尾字节和含非法字符的字节会被忽略
+        """
         # 确定进制
         base = self.base if self.base else 2
         
-        # 将进制字符串转换为字节
-        byte_data = bytearray()
-        
-        # 根据进制确定每个字节需要的字符数
-        if base <= 4:
-            chars_per_byte = 2
-        elif base <= 16:
-            chars_per_byte = 2
+        if isinstance(base_string, np.ndarray):
+            digits = base_string.astype(np.uint8, copy=False)
         else:
-            chars_per_byte = 1
+            digits = string_to_digits(base_string)
         
-        # 将进制字符串转换为字节
-        for i in range(0, len(base_string), chars_per_byte):
-            byte_str = base_string[i:i+chars_per_byte]
-            if len(byte_str) < chars_per_byte:  # 忽略不完整的字节
-                break
-            
-            try:
-                # 将进制字符串转换为整数值
-                byte_value = int(byte_str, base)
-                byte_data.append(byte_value)
-            except ValueError:
-                # 如果转换失败，跳过这个字符
-                continue
+        if self.fixed_width:
+            # 带格式头的图片使用定长编码
+            return fixed_digits_to_bytes(digits[:len(digits) // digits_per_byte(base) * digits_per_byte(base)], base)
         
-        try:
-            # 使用UTF-8解码字节
-            decoded_text = byte_data.decode('utf-8')
-            # 移除可能的空字符
-            return decoded_text.replace('\x00', '')
-        except UnicodeDecodeError:
-            # 如果UTF-8解码失败，尝试使用其他方式
-            text = ""
-            for i in range(0, len(base_string), chars_per_byte):
-                byte_str = base_string[i:i+chars_per_byte]
-                if len(byte_str) < chars_per_byte:
-                    break
-                try:
-                    char_code = int(byte_str, base)
-                    if char_code > 0:  # 忽略空字符
-                        text += chr(char_code)
-                except ValueError:
-                    continue
-            return text
+        # 每个字节两位，忽略不完整的字节
+        pairs = digits[:len(digits) // 2 * 2].reshape(-1, 2)
+        
+        # 跳过含有不属于当前进制字符的字节，其余按 高位*进制+低位 一次算出
+        valid = (pairs < base).all(axis=1)
+        values = pairs[:, 0].astype(np.uint16) * base + pairs[:, 1]
+        return values[valid].astype(np.uint8).tobytes()
     
     def decrypt_from_image(self, img_path):
         """
@@ -766,30 +2294,96 @@ class ImageToTextDecryptor:
         decrypted_text = self.binary_to_text(base_string)
         return decrypted_text, base_string, base
 
+    def extract_digits_from_shards(self, shards, keep_background=False):
+        """
+        从多张分片图片中按顺序提取并拼接进制数字
+        :param shards: 分片清单(.json)路径、分片图片路径列表或glob模式
+        :param keep_background: 没有清单时是否保留白色块（见extract_digits_from_image）。
+                                有清单时总是按清单记录的位数精确截取并校验CRC
+        :return: (np.uint8数字数组, 识别出的进制)
+        """
+        manifest, shard_paths = resolve_shards(shards)
+        
+        if manifest is None:
+            parts = [self.extract_digits_from_image(path, keep_background)[0] for path in shard_paths]
+            return np.concatenate(parts), self.base
+        
+        # 清单中记录了编码参数，无需猜测
+        self.base = manifest['base']
+        self.block_width = manifest['block_width']
+        self.block_height = manifest['block_height']
+        
+        entries = sorted(manifest['shards'], key=lambda entry: entry['index'])
+        parts = []
+        for entry, path in zip(entries, shard_paths):
+            digits, _ = self.extract_digits_from_image(path, keep_background=True)
+            digits = digits[:entry['digits']]
+            if len(digits) != entry['digits'] or zlib.crc32(digits.tobytes()) != entry['crc32']:
+                raise ValueError(f"分片 {entry['index'] + 1} 校验失败: {path}")
+            parts.append(digits)
+        
+        digits = np.concatenate(parts)
+        if len(digits) != manifest['total_digits']:
+            raise ValueError(f"分片数据不完整: 需要 {manifest['total_digits']} 位，实际只有 {len(digits)} 位")
+        return digits, self.base
+    
+    def decrypt_from_shards(self, shards):
+        """
+        从多张分片图片中解密文本
+        :param shards: 分片清单(.json)路径、分片图片路径列表或glob模式
+        :return: (解密后的文本, 进制字符串, 识别出的进制)
+        """
+        digits, base = self.extract_digits_from_shards(shards)
+        return self.binary_to_text(digits), digits_to_string(digits), base
+
 
 class FileToImageEncryptor(TextToImageEncryptor):
     """
     文件到图片的加密器，继承自TextToImageEncryptor
-    将文件转换为Base64编码，然后使用文本加密方法进行加密
+    默认将文件字节连同紧凑的二进制头部直接转换为进制数字；
+    也可选择旧格式：转换为Base64编码后使用文本加密方法进行加密
     """
     
-    def __init__(self, block_width=9, block_height=16, base=16):
+    def __init__(self, block_width=9, block_height=16, base=16, image_mode='RGB', embed_header=True, workers=1,
+                 executor='thread'):
         """
         初始化文件加密器
         :param block_width: 每个位的宽度（像素）
         :param block_height: 每个位的高度（像素）
         :param base: 进制，支持2-16
+        :param image_mode: 输出图片模式，'RGB'、'P'或'1'（仅二进制）
+        :param embed_header: 是否在图片开头写入格式头，为False时生成旧格式图片
+        :param workers: 生成图片时使用的线程数，为None时使用全部CPU核心
+        :param executor: 分段并行的方式，见EXECUTORS
+        """
+        super().__init__(block_width, block_height, base, image_mode, embed_header, workers, executor)
+    
+    def encode_bytes(self, data, file_name='', flags=0, part=None):
+        """
+        将字节数据封装为原生文件容器并转换为定长编码的进制数字
+        :param data: 文件数据（bytes、bytearray、memoryview或np.uint8数组）
+        :param file_name: 文件名，解密时用于还原
+        :param flags: 容器标志位
+        :param part: 分块信息 (分块序号, 分块总数, 偏移, 文件总大小)，为None表示完整文件
+        :return: np.uint8数字数组
         """
-        super().__init__(block_width, block_height, base)
+        header = pack_file_header(file_name, len(memoryview(data).cast('B')), flags, part)
+        return np.concatenate([
+            bytes_to_digits(header, self.base, fixed_width=True),
+            bytes_to_digits(data, self.base, fixed_width=True)
+        ])
     
-    def encrypt_file_to_image(self, file_path, output_img_path, max_width=800, ignore_pixel_limit=False):
+    def encrypt_file_to_image(self, file_path, output_img_path, max_width=DEFAULT_MAX_WIDTH, ignore_pixel_limit=False,
+                              legacy_base64=False, streaming=False):
         """
         将文件加密为图片
         :param file_path: 要加密的文件路径
         :param output_img_path: 输出图片路径
-        :param max_width: 图片最大宽度
+        :param max_width: 图片最大宽度或自动布局，见parse_layout
         :param ignore_pixel_limit: 是否忽略像素限制
-        :return: (base64字符串, 实际保存路径)
+        :param legacy_base64: 是否使用旧的Base64文本格式（FILEINFO:文件名:扩展名:数据）
+        :param streaming: 是否逐行流式写入PNG（仅.png路径）
+        :return: (进制字符串, 实际保存路径)
         """
         # 检查文件是否存在
         if not os.path.exists(file_path):
@@ -799,7 +2393,7 @@ class FileToImageEncryptor(TextToImageEncryptor):
         max_file_size = 10 * 1024 * 1024  # 10MB
         file_size = os.path.getsize(file_path)
         if file_size > max_file_size:
-            raise ValueError(f"文件过大 ({file_size / (1024*1024):.2f} MB)，请使用小于 {max_file_size / (1024*1024):.2f} MB 的文件。")
+            raise ValueError(f"文件过大 ({file_size / (1024*1024):.2f} MB)，请使用小于 {max_file_size / (1024*1024):.2f} MB 的文件，或使用 encrypt_file_to_images 分块加密。")
         
         # 获取文件名和扩展名
         file_name = os.path.basename(file_path)
@@ -809,64 +2403,270 @@ class FileToImageEncryptor(TextToImageEncryptor):
         with open(file_path, 'rb') as file:
             file_data = file.read()
         
-        # 将文件内容转换为Base64编码
-        base64_data = base64.b64encode(file_data).decode('utf-8')
+        if legacy_base64:
+            # 将文件内容转换为Base64编码
+            base64_data = base64.b64encode(file_data).decode('utf-8')
+            
+            # 添加文件信息头，格式为: FILEINFO:filename:extension:base64data
+            file_info = f"FILEINFO:{file_name}:{file_ext}:{base64_data}"
+            
+            # 使用父类的文本加密方法
+            return self.encrypt_to_image(file_info, output_img_path, max_width, ignore_pixel_limit, streaming)
+        
+        # 原生格式：文件字节直接转换为进制数字，无需Base64膨胀
+        actual_path = self._resolve_output_path(output_img_path)
+        digits = self.encode_bytes(file_data, file_name)
+        
+        metadata = self.png_metadata(len(digits), max_width, payload='file', file_name=file_name, file_size=file_size)
+        self._save_digits_image(digits, actual_path, ignore_pixel_limit, streaming, max_width, metadata)
+        print(f"文件加密完成! {file_name} ({file_size} 字节) 已保存到: {actual_path}")
+        
+        return digits_to_string(digits), actual_path
+    
+    def encrypt_file_to_images(self, file_path, output_img_path, chunk_size=None, max_width=DEFAULT_MAX_WIDTH):
+        """
+        流式加密大文件：按固定大小分块读取，每个分块生成一张图片并立即保存，
+        峰值内存只取决于分块大小而与文件大小无关
+        :param file_path: 要加密的文件路径
+        :param output_img_path: 输出图片路径，各分块保存为 名称_part0001.png 等
+        :param chunk_size: 每个分块的字节数，为None时取单张图片不超过像素限制的最大值
+        :param max_width: 图片最大宽度或自动布局，见parse_layout
+        :return: 各分块图片的实际保存路径列表
+        """
+        # 检查文件是否存在
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"文件不存在: {file_path}")
+        
+        file_name = os.path.basename(file_path)
+        file_size = os.path.getsize(file_path)
+        if chunk_size is None:
+            chunk_size = self.max_chunk_size(file_name, max_width)
+        if chunk_size <= 0:
+            raise ValueError(f"分块大小必须为正数: {chunk_size}")
+        part_count = max(1, (file_size + chunk_size - 1) // chunk_size)
+        
+        base_name, ext = os.path.splitext(output_img_path)
+        actual_paths = []
+        with open(file_path, 'rb') as file:
+            for part_index in range(part_count):
+                chunk = file.read(chunk_size)
+                part = (part_index, part_count, part_index * chunk_size, file_size)
+                digits = self.encode_bytes(chunk, file_name, part=part)
+                
+                actual_path = self._resolve_output_path(f"{base_name}_part{part_index + 1:04d}{ext}")
+                metadata = self.png_metadata(len(digits), max_width, payload='file', file_name=file_name,
+                                             file_size=file_size, part_index=part_index, part_count=part_count)
+                self._save_digits_image(digits, actual_path, streaming=True, max_width=max_width, metadata=metadata)
+                actual_paths.append(actual_path)
+                print(f"分块 {part_index + 1}/{part_count} 已保存到: {actual_path}")
+        
+        print(f"文件加密完成! {file_name} ({file_size} 字节) 共 {part_count} 张图片")
+        return actual_paths
+    
+    def max_chunk_size(self, file_name='', max_width=DEFAULT_MAX_WIDTH):
+        """
+        计算单张图片在像素限制内可以容纳的最大分块大小
+        :param file_name: 文件名，会占用容器头部空间
+        :param max_width: 图片最大宽度或自动布局，见parse_layout
+        :return: 分块大小（字节）
+        """
+        max_bytes = self.digit_capacity(MAX_PIXELS, max_width) // digits_per_byte(self.base)
         
-        # 添加文件信息头，格式为: FILEINFO:filename:extension:base64data
-        file_info = f"FILEINFO:{file_name}:{file_ext}:{base64_data}"
+        header_size = len(pack_file_header(file_name, 0, part=(0, 0, 0, 0)))
+        if max_bytes <= header_size:
+            raise ValueError(f"块尺寸 {self.block_width}x{self.block_height} 过大，单张图片无法容纳任何文件数据")
+        return max_bytes - header_size
+    
+    def encrypt_file_to_shards(self, file_path, output_img_path, max_shard_pixels=MAX_PIXELS, max_width=DEFAULT_MAX_WIDTH):
+        """
+        将文件加密为多张分片图片，每张图片不超过指定像素数，并生成分片清单
+        :param file_path: 要加密的文件路径
+        :param output_img_path: 输出图片路径
+        :param max_shard_pixels: 每张分片图片的最大像素数
+        :param max_width: 图片最大宽度或自动布局，见parse_layout
+        :return: (清单路径, 分片图片路径列表)
+        """
+        # 检查文件是否存在
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"文件不存在: {file_path}")
         
-        # 使用父类的文本加密方法
-        base_string, actual_path = self.encrypt_to_image(file_info, output_img_path, max_width, ignore_pixel_limit)
+        with open(file_path, 'rb') as file:
+            file_data = file.read()
         
-        return base_string, actual_path
+        file_name = os.path.basename(file_path)
+        digits = self.encode_bytes(file_data, file_name)
+        return self.save_digits_as_shards(digits, output_img_path, max_shard_pixels, payload='file', max_width=max_width,
+                                          metadata={'file_name': file_name, 'file_size': len(file_data)})
 
 
 class ImageToFileDecryptor(ImageToTextDecryptor):
     """
     图片到文件的解密器，继承自ImageToTextDecryptor
-    从图片中解密Base64编码的文件数据，并还原为原始文件
+    从图片中解密原生容器或Base64编码的文件数据，并还原为原始文件
     """
     
-    def __init__(self, block_width=9, block_height=16, base=None, ignore_pixel_limit=False):
+    def __init__(self, block_width=9, block_height=16, base=None, ignore_pixel_limit=False, sampler='center',
+                 workers=1, executor='thread'):
         """
         初始化文件解密器
         :param block_width: 每个位的宽度（像素）
         :param block_height: 每个位的高度（像素）
         :param base: 进制，支持2-16，如果为None则自动识别
         :param ignore_pixel_limit: 是否忽略像素限制，默认为False
+        :param sampler: 块采样方式，见SAMPLERS，默认只读取块中心像素
+        :param workers: 识别颜色时使用的线程数，为None时使用全部CPU核心
+        :param executor: 分段并行的方式，见EXECUTORS
+        """
+        super().__init__(block_width, block_height, base, ignore_pixel_limit, sampler, workers, executor)
+    
+    def decode_bytes(self, digits):
+        """
+        从定长编码的进制数字中解析原生文件容器
+        :param digits: 进制数字数组（包含白色背景对应的0），末尾允许有填充
+        :return: FileContainer
         """
-        super().__init__(block_width, block_height, base, ignore_pixel_limit)
+        base = self.base if self.base else 2
+        width = digits_per_byte(base)
+        
+        # 先只还原头部，得到容器总长度后再还原所需的部分
+        header = fixed_digits_to_bytes(digits[:_FILE_HEADER.size * width], base)
+        total = file_container_length(header)
+        return unpack_file_container(fixed_digits_to_bytes(digits[:total * width], base))
     
     def decrypt_image_to_file(self, img_path, output_dir=None):
         """
         从图片中解密文件
         :param img_path: 包含加密信息的图片路径
         :param output_dir: 输出目录，如果为None则使用当前目录
-        :return: (文件路径, 文件名, 文件扩展名, 解密文本, 二进制表示)
+        :return: (文件路径, 文件名, 文件扩展名, 解密文本, 二进制表示)。
+                 原生格式没有解密文本，此时解密文本为文件信息摘要
         """
-        # 使用父类的解密方法获取文本
-        decrypted_text, base_string, detected_base = self.decrypt_from_image_with_binary(img_path)
+        # 保留白色块一次性提取所有数字，原生格式和旧格式共用
+        digits, detected_base = self.extract_digits_from_image(img_path, keep_background=True)
         
-        # 检查是否是文件信息格式
-        if not decrypted_text.startswith("FILEINFO:"):
-            raise ValueError("图片中不包含有效的文件加密信息")
+        try:
+            container = self.decode_bytes(digits)
+        except ValueError:
+            container = None
         
-        # 解析文件信息
+        if container is not None:
+            if container.part_count > 1:
+                raise ValueError(
+                    f"该图片是分块文件 {container.file_name} 的第 {container.part_index + 1}/{container.part_count} 部分，"
+                    f"请使用 decrypt_images_to_file 传入全部分块图片"
+                )
+            file_name, file_data = container.file_name, container.data
+            file_ext = os.path.splitext(file_name)[1]
+            decrypted_text = f"{file_name} ({len(file_data)} 字节)"
+            base_string = digits_to_string(digits)
+        else:
+            # 旧格式：去掉白色背景后与文本解密提取的数字一致；按记录的位数精确提取时原样解析
+            legacy_digits = digits if self.exact_digits else digits[~self.background_mask]
+            file_name, file_ext, file_data, decrypted_text, base_string = self._decode_legacy_base64(legacy_digits)
+        
+        output_file_path = self._resolve_output_file(output_dir, file_name)
+        
+        # 写入文件
+        with open(output_file_path, 'wb') as file:
+            file.write(file_data)
+        
+        return output_file_path, file_name, file_ext, decrypted_text, base_string
+    
+    def decrypt_images_to_file(self, img_paths, output_dir=None):
+        """
+        从分块加密的多张图片中还原文件，每张图片解码后直接写入对应偏移，内存占用只取决于单个分块。
+        传入的是分片加密的全部分片图片时，按顺序拼接后整体还原，见decrypt_shards_to_file
+        :param img_paths: 全部分块图片的路径，顺序不限；分片图片需按顺序排列
+        :param output_dir: 输出目录，如果为None则使用当前目录
+        :return: (文件路径, 文件名, 文件扩展名)
+        """
+        if not img_paths:
+            raise ValueError("没有提供要解密的图片")
+        
+        first = None
+        seen_parts = set()
+        output_file_path = None
+        output_file = None
         try:
-            parts = decrypted_text.split(":", 3)
-            if len(parts) != 4:
-                raise ValueError("文件信息格式不正确")
+            for img_path in img_paths:
+                digits, _ = self.extract_digits_from_image(img_path, keep_background=True)
+                try:
+                    container = self.decode_bytes(digits)
+                except ValueError as e:
+                    # 分片图片不是独立的分块，只能按顺序拼接后整体解码
+                    if first is None and self._is_first_shard(digits):
+                        return self.decrypt_shards_to_file(img_paths, output_dir)
+                    raise ValueError(f"{img_path} 不是完整的文件分块（{e}）；"
+                                     f"如果这些图片是分片加密生成的，请传入分片清单(.json)")
+                
+                if first is None:
+                    first = container
+                    output_file_path = self._resolve_output_file(output_dir, container.file_name)
+                    output_file = open(output_file_path, 'wb')
+                elif (container.file_name, container.part_count, container.total_size) != \
+                        (first.file_name, first.part_count, first.total_size):
+                    raise ValueError(f"图片 {img_path} 与其他分块不属于同一个文件")
+                
+                if container.part_index in seen_parts:
+                    raise ValueError(f"分块 {container.part_index + 1} 重复出现: {img_path}")
+                seen_parts.add(container.part_index)
+                
+                # 直接写入分块在文件中的位置
+                output_file.seek(container.offset)
+                output_file.write(container.data)
+                print(f"已还原分块 {container.part_index + 1}/{container.part_count}: {img_path}")
             
-            _, file_name, file_ext, base64_data = parts
-        except Exception as e:
-            raise ValueError(f"解析文件信息失败: {str(e)}")
+            missing = sorted(set(range(first.part_count)) - seen_parts)
+            if missing:
+                raise ValueError(f"缺少分块: {', '.join(str(index + 1) for index in missing)}")
+            output_file.truncate(first.total_size)
+        except Exception:
+            # 还原失败时删除不完整的输出文件
+            if output_file is not None:
+                output_file.close()
+                os.remove(output_file_path)
+            raise
         
-        # 将Base64数据解码为二进制
+        output_file.close()
+        return output_file_path, first.file_name, os.path.splitext(first.file_name)[1]
+    
+    def _is_first_shard(self, digits):
+        """
+        判断数字是否以普通（非分块）文件容器的头部开头，即分片加密的第一张分片
+        :param digits: 一张图片中的进制数字数组
+        :return: 是否为第一张分片
+        """
+        base = self.base if self.base else 2
         try:
-            file_data = base64.b64decode(base64_data)
-        except Exception as e:
-            raise ValueError(f"Base64解码失败: {str(e)}")
+            header = fixed_digits_to_bytes(digits[:_FILE_HEADER.size * digits_per_byte(base)], base)
+            file_container_length(header)
+        except ValueError:
+            return False
+        return not _FILE_HEADER.unpack_from(header)[1] & FILE_FLAG_PART
+    
+    def decrypt_shards_to_file(self, shards, output_dir=None):
+        """
+        从多张分片图片中还原文件
+        :param shards: 分片清单(.json)路径、分片图片路径列表或glob模式
+        :param output_dir: 输出目录，如果为None则使用当前目录
+        :return: (文件路径, 文件名, 文件扩展名)
+        """
+        digits, _ = self.extract_digits_from_shards(shards, keep_background=True)
+        container = self.decode_bytes(digits)
+        
+        output_file_path = self._resolve_output_file(output_dir, container.file_name)
+        with open(output_file_path, 'wb') as file:
+            file.write(container.data)
         
+        return output_file_path, container.file_name, os.path.splitext(container.file_name)[1]
+    
+    def _resolve_output_file(self, output_dir, file_name):
+        """
+        确定还原文件的保存路径，目录不存在时创建，文件已存在时添加序号
+        :param output_dir: 输出目录，如果为None则使用当前目录
+        :param file_name: 文件名
+        :return: 输出文件路径
+        """
         # 确定输出目录
         if output_dir is None:
             output_dir = os.getcwd()
@@ -879,16 +2679,42 @@ class ImageToFileDecryptor(ImageToTextDecryptor):
         
         # 如果文件已存在，添加序号
         counter = 1
+        name_without_ext, file_ext = os.path.splitext(file_name)
         while os.path.exists(output_file_path):
-            name_without_ext = os.path.splitext(file_name)[0]
             output_file_path = os.path.join(output_dir, f"{name_without_ext}_{counter}{file_ext}")
             counter += 1
         
-        # 写入文件
-        with open(output_file_path, 'wb') as file:
-            file.write(file_data)
+        return output_file_path
+    
+    def _decode_legacy_base64(self, digits):
+        """
+        解析旧的Base64文本格式（FILEINFO:文件名:扩展名:数据）
+        :param digits: 忽略白色背景后的进制数字数组
+        :return: (文件名, 文件扩展名, 文件数据, 解密文本, 二进制表示)
+        """
+        decrypted_text = self.binary_to_text(digits)
         
-        return output_file_path, file_name, file_ext, decrypted_text, base_string
+        # 检查是否是文件信息格式
+        if not decrypted_text.startswith("FILEINFO:"):
+            raise ValueError("图片中不包含有效的文件加密信息")
+        
+        # 解析文件信息
+        try:
+            parts = decrypted_text.split(":", 3)
+            if len(parts) != 4:
+                raise ValueError("文件信息格式不正确")
+            
+            _, file_name, file_ext, base64_data = parts
+        except Exception as e:
+            raise ValueError(f"解析文件信息失败: {str(e)}")
+        
+        # 将Base64数据解码为二进制
+        try:
+            file_data = base64.b64decode(base64_data)
+        except Exception as e:
+            raise ValueError(f"Base64解码失败: {str(e)}")
+        
+        return file_name, file_ext, file_data, decrypted_text, digits_to_string(digits)
 
 
 def is_image_file(file_path):
@@ -953,56 +2779,363 @@ def create_sample_carrier_image(output_path, width=800, height=600):
     print(f"示例载体图片已创建: {output_path}")
 
 
+# 批量处理：每个工作进程只初始化一次加密器/解密器，之后依次处理分配到的各项
+_batch_worker = None
+
+
+def collect_batch_inputs(source, images_only=False):
+    """
+    收集批量处理的输入文件
+    :param source: 目录（递归收集其中的所有文件），或每行一个路径的列表文件（忽略空行和#开头的行）
+    :param images_only: 收集目录时是否只保留图片文件
+    :return: [(文件路径, 相对路径)]，相对路径用于在输出目录中保持目录结构
+    """
+    if os.path.isdir(source):
+        items = []
+        for dir_path, dir_names, file_names in os.walk(source):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                path = os.path.join(dir_path, file_name)
+                if images_only and not is_image_file(path):
+                    continue
+                items.append((path, os.path.relpath(path, source)))
+        return items
+
+    list_dir = os.path.dirname(os.path.abspath(source))
+    items = []
+    with open(source, 'r', encoding='utf-8') as list_file:
+        for line in list_file:
+            path = line.strip()
+            if not path or path.startswith('#'):
+                continue
+            # 列表中的相对路径相对于列表文件所在目录
+            if not os.path.isabs(path):
+                path = os.path.join(list_dir, path)
+            items.append((path, os.path.basename(path)))
+    return items
+
+
+def _init_batch_worker(worker_factory):
+    """
+    工作进程初始化：创建本进程中交给handler的对象
+    """
+    global _batch_worker
+    _batch_worker = worker_factory()
+
+
+def _run_batch(handler, tasks, workers, worker_factory):
+    """
+    在进程池中批量处理，按输入顺序逐项产出结果
+    :param handler: 模块级函数 handler(worker, task)，返回该项的结果字段
+    :param tasks: 任务列表
+    :param workers: 工作进程数，为None时使用全部CPU核心，为1时在当前进程中处理
+    :param worker_factory: 可序列化的无参可调用对象（如functools.partial），
+                           每个工作进程调用一次，得到交给handler的worker
+    :return: 结果字典的生成器
+    """
+    if workers == 1 or len(tasks) <= 1:
+        worker = worker_factory()
+        for task in tasks:
+            yield _run_batch_task(handler, worker, task)
+        return
+
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    # 每次分配若干项，减少大量小文件时的进程间通信次数
+    chunksize = max(1, len(tasks) // (workers * 8))
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_batch_worker,
+                                                initargs=(worker_factory,)) as executor:
+        yield from executor.map(_run_batch_item, [handler] * len(tasks), tasks, chunksize=chunksize)
+
+
+def _run_batch_item(handler, task):
+    """
+    工作进程中处理一项，使用进程初始化时创建的加密器或解密器
+    """
+    return _run_batch_task(handler, _batch_worker, task)
+
+
+def _run_batch_task(handler, worker, task):
+    """
+    处理一项并计时。任务的第一项为输入路径；单项失败只记录错误，不影响其余各项；
+    加解密过程中的调试输出被丢弃
+    """
+    start = time.perf_counter()
+    result = {'path': task[0]}
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            result.update(handler(worker, task))
+        result['status'] = 'ok'
+    except Exception as e:
+        result.update(status='error', error=f"{type(e).__name__}: {e}")
+    result['seconds'] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def _encrypt_batch_item(encryptor, task):
+    """
+    批量加密中的一项：task为(输入文件, 输出图片路径, 是否分块流式加密, 布局)
+    """
+    file_path, output_path, stream, max_width = task
+    if stream:
+        outputs = encryptor.encrypt_file_to_images(file_path, output_path, max_width=max_width)
+    else:
+        outputs = [encryptor.encrypt_file_to_image(file_path, output_path, max_width)[1]]
+    return {'outputs': outputs, 'bytes': os.path.getsize(file_path)}
+
+
+def batch_encrypt(items, output_dir, workers=None, stream=False, max_width=DEFAULT_MAX_WIDTH, **options):
+    """
+    用进程池将多个文件分别加密为图片，避免每个文件单独启动解释器
+    :param items: collect_batch_inputs返回的[(文件路径, 相对路径)]
+    :param output_dir: 输出目录，图片按相对路径保存为 相对路径.png
+    :param workers: 工作进程数，为None时使用全部CPU核心
+    :param stream: 是否对每个文件使用分块流式加密（适用于大文件）
+    :param max_width: 图片最大宽度或自动布局，见parse_layout
+    :param options: 传给FileToImageEncryptor的参数（block_width、block_height、base、image_mode、embed_header）
+    :return: 每项结果字典的生成器，按输入顺序产出，
+             包含path、outputs、bytes、status（ok或error）、error和seconds
+    """
+    output_dir = os.path.abspath(output_dir)
+    tasks = []
+    used = set()
+    for file_path, relative_path in items:
+        output_path = os.path.join(output_dir, relative_path + '.png')
+        # 同名输入预先分配不同的输出路径，避免并行保存时互相覆盖
+        candidate, counter = output_path, 1
+        while candidate in used:
+            stem, ext = os.path.splitext(output_path)
+            candidate = f"{stem}_{counter}{ext}"
+            counter += 1
+        used.add(candidate)
+        os.makedirs(os.path.dirname(candidate), exist_ok=True)
+        tasks.append((file_path, candidate, stream, max_width))
+    return _run_batch(_encrypt_batch_item, tasks, workers, functools.partial(FileToImageEncryptor, **options))
+
+
+def _decrypt_text_batch_item(new_decryptor, task):
+    """
+    批量按文本解密中的一项：task为(图片路径,)。加密的是文件的图片报错，
+    length为解码出的载荷字节数
+    """
+    img_path, = task
+    metadata = inspect_image(img_path)
+    if metadata is not None and metadata.get('payload') == 'file':
+        raise ValueError("图片中加密的是文件，请指定输出目录按文件解密")
+
+    decryptor = new_decryptor()
+    digits, base = decryptor.extract_digits_from_image(img_path)
+    payload = decryptor.digits_to_bytes(digits)
+    if decryptor.fixed_width and payload.startswith(FILE_CONTAINER_MAGIC):
+        # 只有格式头、没有PNG文本块的图片，按载荷开头的文件容器头部识别
+        raise ValueError("图片中加密的是文件，请指定输出目录按文件解密")
+    return {'base': base, 'length': len(payload), 'text': bytes_to_text(payload)}
+
+
+def _decrypt_file_batch_item(new_decryptor, task):
+    """
+    批量按文件解密中的一项：task为(图片路径, 输出目录)
+    """
+    img_path, output_dir = task
+    decryptor = new_decryptor()
+    output_path = decryptor.decrypt_image_to_file(img_path, output_dir)[0]
+    return {'base': decryptor.base, 'length': os.path.getsize(output_path), 'output': output_path}
+
+
+def batch_decrypt(items, output_dir=None, workers=None, **options):
+    """
+    用进程池批量解密多张图片
+    :param items: collect_batch_inputs返回的[(图片路径, 相对路径)]
+    :param output_dir: 按文件解密时的输出目录（保持输入的目录结构），为None时按文本解密
+    :param workers: 工作进程数，为None时使用全部CPU核心
+    :param options: 传给解密器的参数（block_width、block_height、base、sampler等）
+    :return: 每项结果字典的生成器，按输入顺序产出，包含path、base（识别出的进制）、
+             length（载荷字节数）、text（文本解密）或output（文件解密）、status、error和seconds
+    """
+    if output_dir is None:
+        handler, decryptor_class = _decrypt_text_batch_item, ImageToTextDecryptor
+        tasks = [(img_path,) for img_path, _ in items]
+    else:
+        handler, decryptor_class = _decrypt_file_batch_item, ImageToFileDecryptor
+        tasks = []
+        for img_path, relative_path in items:
+            target_dir = os.path.join(os.path.abspath(output_dir), os.path.dirname(relative_path))
+            os.makedirs(target_dir, exist_ok=True)
+            tasks.append((img_path, target_dir))
+    # 解密器会记住识别出的进制和块尺寸，因此工作进程中的worker是解密器工厂，每张图片创建新的解密器
+    return _run_batch(handler, tasks, workers, functools.partial(functools.partial, decryptor_class, **options))
+
+
+def _write_batch_results(results, output_path=None):
+    """
+    逐项写出批量处理结果，每项一行JSON，处理完一项立即写出
+    :param results: 结果字典的可迭代对象
+    :param output_path: 输出文件路径，为None时写到标准输出
+    :return: 失败的项数
+    """
+    failed = 0
+    with (open(output_path, 'w', encoding='utf-8') if output_path else contextlib.nullcontext(sys.stdout)) as output:
+        for result in results:
+            failed += result['status'] != 'ok'
+            output.write(json.dumps(result, ensure_ascii=False) + '\n')
+            output.flush()
+    return failed
+
+
+def _layout_argument(value):
+    """
+    命令行--max-width参数：整数宽度或自动布局
+    """
+    try:
+        parse_layout(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value if value.strip().lower().startswith('auto') else int(value)
+
+
+def _block_size_argument(value):
+    """
+    命令行解密时的--block-width/--block-height参数：正整数或auto
+    """
+    if value.strip().lower() == BLOCK_SIZE_AUTO:
+        return BLOCK_SIZE_AUTO
+    try:
+        size = int(value)
+    except ValueError:
+        size = 0
+    if size < 1:
+        raise argparse.ArgumentTypeError(f"无效的块尺寸: {value}，应为正整数或{BLOCK_SIZE_AUTO}")
+    return size
+
+
+def _encode_options(default_base):
+    """
+    加密类命令（encrypt、file_encrypt、batch_encrypt、plan）共用的编码参数
+    :param default_base: 默认进制，文本加密为2，文件加密为16
+    :return: 用作parents的argparse.ArgumentParser
+    """
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--block-width', type=int, default=None,
+                         help='每个位的宽度（像素），默认为9，像素密集模式下默认为1')
+    options.add_argument('--block-height', type=int, default=None,
+                         help='每个位的高度（像素），默认为16，像素密集模式下默认为1')
+    options.add_argument('--max-width', type=_layout_argument, default=DEFAULT_MAX_WIDTH,
+                         help='图片最大宽度，超过时会自动换行，默认为800；auto生成接近正方形的图片，auto:16:9等指定宽高比')
+    options.add_argument('--base', type=int, default=default_base, choices=range(2, 17),
+                         help='进制，支持2-16，默认为%(default)s')
+    options.add_argument('--image-mode', default='RGB', choices=IMAGE_MODES,
+                         help='输出图片模式：RGB彩色、P调色板索引、1为1位黑白（仅二进制），默认为RGB')
+    options.add_argument('--dense', action='store_true',
+                         help='像素密集模式：每位默认1x1像素，总是写入格式头')
+    options.add_argument('--no-header', action='store_true',
+                         help='不在图片开头写入格式头，生成旧格式图片（解密时需指定块尺寸）')
+    return options
+
+
+def _decode_options():
+    """
+    解密类命令（decrypt、file_decrypt、batch_decrypt）共用的识别参数
+    :return: 用作parents的argparse.ArgumentParser
+    """
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--block-width', type=_block_size_argument, default=9,
+                         help='每个位的宽度（像素），默认为9，auto为自动检测，带格式头的图片以格式头为准')
+    options.add_argument('--block-height', type=_block_size_argument, default=16,
+                         help='每个位的高度（像素），默认为16，auto为自动检测，带格式头的图片以格式头为准')
+    options.add_argument('--base', type=int, default=None, choices=range(2, 17), nargs='?',
+                         help='进制，支持2-16，如果不指定则自动识别，带格式头的图片以格式头为准')
+    options.add_argument('--sampler', default='center', choices=SAMPLERS,
+                         help='块采样方式：center只读取块中心像素；mean/median取块内部窗口的平均值/中位数，适用于有损压缩或轻微缩放的图片')
+    return options
+
+
+def _band_options():
+    """
+    单张图片按块行分段并行处理的参数，用于encrypt、file_encrypt、decrypt和file_decrypt。
+    批量命令的--workers是工作进程数，单独定义
+    :return: 用作parents的argparse.ArgumentParser
+    """
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--workers', type=int, default=1,
+                         help='处理大图片时按块行分段并行渲染或识别的线程数，默认为1，0为CPU核心数')
+    options.add_argument('--executor', default='thread', choices=EXECUTORS,
+                         help='分段并行方式：thread使用线程池（默认），process使用进程池并通过共享内存传递像素')
+    return options
+
+
 def main():
     parser = argparse.ArgumentParser(description="文本到图片的加密解密工具")
     subparsers = parser.add_subparsers(dest='command', help='可用命令')
+    # 多个命令共用的参数只定义一次，避免各命令的默认值和说明不一致
+    decode_options = _decode_options()
+    band_options = _band_options()
     
     # 加密命令
-    encrypt_parser = subparsers.add_parser('encrypt', help='将文本加密为图片')
+    encrypt_parser = subparsers.add_parser('encrypt', help='将文本加密为图片',
+                                           parents=[_encode_options(2), band_options])
     encrypt_parser.add_argument('text', help='要加密的文本')
     encrypt_parser.add_argument('output_img', help='输出图片路径')
-    encrypt_parser.add_argument('--block-width', type=int, default=9, 
-                               help='每个位的宽度（像素），默认为9')
-    encrypt_parser.add_argument('--block-height', type=int, default=16, 
-                               help='每个位的高度（像素），默认为16')
-    encrypt_parser.add_argument('--max-width', type=int, default=800, 
-                               help='图片最大宽度，超过时会自动换行，默认为800')
-    encrypt_parser.add_argument('--base', type=int, default=2, choices=range(2, 17),
-                               help='进制，支持2-16，默认为2（二进制）')
+    encrypt_parser.add_argument('--stream', action='store_true',
+                               help='逐块行流式写入PNG（仅.png路径），完整图像不会出现在内存中，适用于大文本')
+    encrypt_parser.add_argument('--shard', action='store_true',
+                               help='按单张图片像素上限自动分片，输出多张图片和分片清单')
+    encrypt_parser.add_argument('--max-shard-pixels', type=int, default=MAX_PIXELS,
+                               help=f'分片时每张图片的最大像素数，默认为{MAX_PIXELS}')
     
     # 解密命令
-    decrypt_parser = subparsers.add_parser('decrypt', help='从图片中解密文本')
-    decrypt_parser.add_argument('img_path', help='包含加密信息的图片路径')
-    decrypt_parser.add_argument('--block-width', type=int, default=9, 
-                              help='每个位的宽度（像素），默认为9')
-    decrypt_parser.add_argument('--block-height', type=int, default=16, 
-                              help='每个位的高度（像素），默认为16')
-    decrypt_parser.add_argument('--base', type=int, default=None, choices=range(2, 17), nargs='?',
-                              help='进制，支持2-16，如果不指定则自动识别')
+    decrypt_parser = subparsers.add_parser('decrypt', help='从图片中解密文本',
+                                           parents=[decode_options, band_options])
+    decrypt_parser.add_argument('img_path', nargs='+', help='包含加密信息的图片路径，分片加密时传入分片清单(.json)或全部分片图片')
     
     # 文件加密命令
-    file_encrypt_parser = subparsers.add_parser('file_encrypt', help='将文件加密为图片')
+    file_encrypt_parser = subparsers.add_parser('file_encrypt', help='将文件加密为图片',
+                                                parents=[_encode_options(16), band_options])
     file_encrypt_parser.add_argument('file_path', help='要加密的文件路径')
     file_encrypt_parser.add_argument('output_img', help='输出图片路径')
-    file_encrypt_parser.add_argument('--block-width', type=int, default=9, 
-                                   help='每个位的宽度（像素），默认为9')
-    file_encrypt_parser.add_argument('--block-height', type=int, default=16, 
-                                   help='每个位的高度（像素），默认为16')
-    file_encrypt_parser.add_argument('--max-width', type=int, default=800, 
-                                   help='图片最大宽度，超过时会自动换行，默认为800')
-    file_encrypt_parser.add_argument('--base', type=int, default=16, choices=range(2, 17),
-                                   help='进制，支持2-16，默认为16（十六进制）')
+    file_encrypt_parser.add_argument('--stream', action='store_true',
+                                   help='分块流式加密，每个分块保存为一张图片，适用于大文件')
+    file_encrypt_parser.add_argument('--chunk-size', type=int, default=None,
+                                   help='流式加密时每个分块的字节数，默认取单张图片像素限制内的最大值')
+    file_encrypt_parser.add_argument('--shard', action='store_true',
+                                   help='按单张图片像素上限自动分片，输出多张图片和分片清单')
+    file_encrypt_parser.add_argument('--max-shard-pixels', type=int, default=MAX_PIXELS,
+                                   help=f'分片时每张图片的最大像素数，默认为{MAX_PIXELS}')
     
     # 文件解密命令
-    file_decrypt_parser = subparsers.add_parser('file_decrypt', help='从图片中解密文件')
-    file_decrypt_parser.add_argument('img_path', help='包含加密信息的图片路径')
+    file_decrypt_parser = subparsers.add_parser('file_decrypt', help='从图片中解密文件',
+                                                parents=[decode_options, band_options])
+    file_decrypt_parser.add_argument('img_path', nargs='+', help='包含加密信息的图片路径，分块加密的文件需传入全部分块图片，分片加密的文件传入分片清单(.json)或按顺序传入全部分片图片')
     file_decrypt_parser.add_argument('--output-dir', help='输出目录，默认为当前目录')
-    file_decrypt_parser.add_argument('--block-width', type=int, default=9, 
-                                   help='每个位的宽度（像素），默认为9')
-    file_decrypt_parser.add_argument('--block-height', type=int, default=16, 
-                                   help='每个位的高度（像素），默认为16')
-    file_decrypt_parser.add_argument('--base', type=int, default=None, choices=range(2, 17), nargs='?',
-                                   help='进制，支持2-16，如果不指定则自动识别')
+    
+    # 批量加密命令
+    batch_encrypt_parser = subparsers.add_parser('batch_encrypt', help='用多个进程将目录或列表文件中的文件批量加密为图片',
+                                                 parents=[_encode_options(16)])
+    batch_encrypt_parser.add_argument('source', help='输入目录（递归处理其中所有文件），或每行一个文件路径的列表文件')
+    batch_encrypt_parser.add_argument('output_dir', help='输出目录，保持输入的目录结构，图片保存为 原文件名.png')
+    batch_encrypt_parser.add_argument('--workers', type=int, default=None,
+                                    help='工作进程数，默认为CPU核心数')
+    batch_encrypt_parser.add_argument('--log', help='结果日志路径（每项一行JSON），默认输出到标准输出')
+    batch_encrypt_parser.add_argument('--stream', action='store_true',
+                                    help='每个文件都分块流式加密，适用于包含大文件的目录')
+    
+    # 批量解密命令
+    batch_decrypt_parser = subparsers.add_parser('batch_decrypt', help='用多个进程批量解密图片，每张图片输出一行JSON',
+                                                 parents=[decode_options])
+    batch_decrypt_parser.add_argument('source', help='图片目录（递归处理其中所有图片），或每行一个图片路径的列表文件')
+    batch_decrypt_parser.add_argument('--output-dir', help='按文件解密并保存到该目录；不指定时按文本解密，结果中包含文本')
+    batch_decrypt_parser.add_argument('--output', help='结果保存路径（每张图片一行JSON），默认输出到标准输出')
+    batch_decrypt_parser.add_argument('--workers', type=int, default=None,
+                                    help='工作进程数，默认为CPU核心数')
+    
+    # 检查图片命令
+    inspect_parser = subparsers.add_parser('inspect', help='只读取文件头，输出加密图片的编码参数（每行一个JSON）')
+    inspect_parser.add_argument('img_path', nargs='+', help='图片路径')
+    
+    # 尺寸估算命令
+    plan_parser = subparsers.add_parser('plan', help='加密前估算图片尺寸、内存占用和PNG大小',
+                                        parents=[_encode_options(16)])
+    plan_parser.add_argument('payload_size', type=int, help='载荷字节数（文本为UTF-8编码后的字节数，文件应包含容器头部）')
+    plan_parser.add_argument('--stream', action='store_true',
+                            help='按流式写入PNG估算内存占用')
     
     # 创建示例图片命令
     create_parser = subparsers.add_parser('create', help='创建示例载体图片')
@@ -1012,24 +3145,58 @@ def main():
     
     args = parser.parse_args()
     
+    if args.command in ('encrypt', 'file_encrypt', 'batch_encrypt', 'plan'):
+        # 未指定块尺寸时，像素密集模式每位只占一个像素
+        default_width, default_height = (DENSE_BLOCK_SIZE, DENSE_BLOCK_SIZE) if args.dense else (9, 16)
+        if args.block_width is None:
+            args.block_width = default_width
+        if args.block_height is None:
+            args.block_height = default_height
+        # 默认写入格式头，像素密集模式总是写入
+        args.embed_header = args.dense or not args.no_header
+    
     if args.command == 'encrypt':
-        encryptor = TextToImageEncryptor(args.block_width, args.block_height, args.base)
-        base_string = encryptor.encrypt_to_image(
-            args.text, 
-            args.output_img, 
-            args.max_width
-        )
-        print(f"原始文本: {args.text}")
-        print(f"进制({args.base})表示: {base_string}")
+        encryptor = TextToImageEncryptor(args.block_width, args.block_height, args.base, args.image_mode,
+                                         args.embed_header, args.workers, args.executor)
+        if args.shard:
+            base_string, manifest_path, _ = encryptor.encrypt_to_shards(args.text, args.output_img, args.max_shard_pixels,
+                                                                            args.max_width)
+        else:
+            base_string, _ = encryptor.encrypt_to_image(
+                args.text, 
+                args.output_img, 
+                args.max_width,
+                streaming=args.stream
+            )
+        print(f"原始文本: {args.text[:50]}..." if len(args.text) > 50 else f"原始文本: {args.text}")
+        print(f"进制({args.base})表示: {base_string[:50]}..." if len(base_string) > 50 else f"进制({args.base})表示: {base_string}")
         print(f"加密完成!")
     
     elif args.command == 'decrypt':
-        decryptor = ImageToTextDecryptor(args.block_width, args.block_height, args.base)
-        text = decryptor.decrypt_from_image(args.img_path)
+        decryptor = ImageToTextDecryptor(args.block_width, args.block_height, args.base, sampler=args.sampler,
+                                         workers=args.workers, executor=args.executor)
+        if len(args.img_path) > 1 or args.img_path[0].lower().endswith('.json'):
+            shards = args.img_path[0] if len(args.img_path) == 1 else args.img_path
+            text, _, _ = decryptor.decrypt_from_shards(shards)
+        else:
+            text = decryptor.decrypt_from_image(args.img_path[0])
         print(f"解密结果: {text}")
     
     elif args.command == 'file_encrypt':
-        encryptor = FileToImageEncryptor(args.block_width, args.block_height, args.base)
+        encryptor = FileToImageEncryptor(args.block_width, args.block_height, args.base, args.image_mode,
+                                         args.embed_header, args.workers, args.executor)
+        if args.stream:
+            actual_paths = encryptor.encrypt_file_to_images(args.file_path, args.output_img, args.chunk_size,
+                                                            args.max_width)
+            print(f"原始文件: {args.file_path}")
+            print(f"加密图片已保存到: {', '.join(actual_paths)}")
+            return
+        if args.shard:
+            manifest_path, _ = encryptor.encrypt_file_to_shards(args.file_path, args.output_img, args.max_shard_pixels,
+                                                                   args.max_width)
+            print(f"原始文件: {args.file_path}")
+            print(f"分片清单已保存到: {manifest_path}")
+            return
         base_string, actual_path = encryptor.encrypt_file_to_image(
             args.file_path, 
             args.output_img, 
@@ -1041,12 +3208,18 @@ def main():
         print(f"文件加密完成!")
     
     elif args.command == 'file_decrypt':
-        decryptor = ImageToFileDecryptor(args.block_width, args.block_height, args.base)
+        decryptor = ImageToFileDecryptor(args.block_width, args.block_height, args.base, sampler=args.sampler,
+                                         workers=args.workers, executor=args.executor)
         try:
-            output_path, file_name, file_ext = decryptor.decrypt_image_to_file(
-                args.img_path, 
-                args.output_dir
-            )
+            if len(args.img_path) == 1 and args.img_path[0].lower().endswith('.json'):
+                output_path, file_name, file_ext = decryptor.decrypt_shards_to_file(args.img_path[0], args.output_dir)
+            elif len(args.img_path) > 1:
+                output_path, file_name, file_ext = decryptor.decrypt_images_to_file(args.img_path, args.output_dir)
+            else:
+                output_path, file_name, file_ext, _, _ = decryptor.decrypt_image_to_file(
+                    args.img_path[0], 
+                    args.output_dir
+                )
             print(f"解密文件已保存到: {output_path}")
             print(f"文件名: {file_name}")
             print(f"文件类型: {file_ext}")
@@ -1054,6 +3227,47 @@ def main():
         except Exception as e:
             print(f"解密失败: {str(e)}")
     
+    elif args.command == 'batch_encrypt':
+        items = collect_batch_inputs(args.source)
+        results = batch_encrypt(items, args.output_dir, args.workers, args.stream, args.max_width,
+                                block_width=args.block_width, block_height=args.block_height, base=args.base,
+                                image_mode=args.image_mode, embed_header=args.embed_header)
+        failed = _write_batch_results(results, args.log)
+        print(f"批量加密完成: 共 {len(items)} 项，失败 {failed} 项", file=sys.stderr)
+        if failed:
+            sys.exit(1)
+    
+    elif args.command == 'batch_decrypt':
+        items = collect_batch_inputs(args.source, images_only=True)
+        results = batch_decrypt(items, args.output_dir, args.workers, block_width=args.block_width,
+                                block_height=args.block_height, base=args.base, sampler=args.sampler)
+        failed = _write_batch_results(results, args.output)
+        print(f"批量解密完成: 共 {len(items)} 张图片，失败 {failed} 张", file=sys.stderr)
+        if failed:
+            sys.exit(1)
+    
+    elif args.command == 'inspect':
+        for img_path in args.img_path:
+            try:
+                metadata = inspect_image(img_path)
+            except Exception as e:
+                metadata = {'error': str(e)}
+            print(json.dumps({'path': img_path, **(metadata or {'error': '不是加密图片'})}, ensure_ascii=False))
+    
+    elif args.command == 'plan':
+        layout_plan = plan(args.payload_size, args.base, args.block_width, args.block_height, args.max_width,
+                           args.image_mode, streaming=args.stream, embed_header=args.embed_header)
+        print(f"位数: {layout_plan.digits}")
+        print(f"网格: {layout_plan.columns} 列 x {layout_plan.rows} 行")
+        print(f"图片尺寸: {layout_plan.width}x{layout_plan.height} = {layout_plan.pixels} 像素")
+        print(f"预计内存: {layout_plan.memory_bytes / (1024 * 1024):.1f} MB")
+        print(f"预计PNG大小: {layout_plan.png_bytes / (1024 * 1024):.1f} MB")
+        if layout_plan.within_limit:
+            print("在单张图片像素限制内")
+        else:
+            capacity = grid_capacity(MAX_PIXELS, args.block_width, args.block_height, args.max_width)
+            print(f"超过单张图片像素限制 ({MAX_PIXELS})，分片加密约需 {-(-layout_plan.digits // max(capacity, 1))} 张图片")
+    
     elif args.command == 'create':
         create_sample_carrier_image(args.output_path, args.width, args.height)
     
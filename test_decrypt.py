@@ -0,0 +1,274 @@
+"""
+文本到图片加密解密工具的测试：不同进制的加密解密往返，以及各种二进制格式
+（文件容器、图片格式头、PNG文本块、流式PNG写入）的打包、解析和损坏输入
+运行: python test_decrypt.py，或 python -m pytest test_decrypt.py
+"""
+
+import contextlib
+import io
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+
+import numpy as np
+from PIL import Image, PngImagePlugin
+
+from image_encryptor import (
+    FILE_CONTAINER_MAGIC, FILE_FLAG_PART, IMAGE_HEADER_VERSION, PNG_METADATA_PREFIX,
+    PNG_METADATA_VERSION, FileToImageEncryptor, ImageToFileDecryptor, ImageToTextDecryptor, PNGStreamWriter,
+    TextToImageEncryptor, file_container_length, image_header_bits, image_header_rows, pack_file_header,
+    pack_image_header, png_info, read_image_header, read_png_metadata, unpack_file_container,
+)
+
+
+class TempDirTestCase(unittest.TestCase):
+    """
+    每个测试使用独立的临时目录，并丢弃加解密过程中的调试输出
+    """
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+        quiet = contextlib.redirect_stdout(io.StringIO())
+        quiet.__enter__()
+        self.addCleanup(quiet.__exit__, None, None, None)
+
+    def path(self, name):
+        return os.path.join(self.temp_dir, name)
+
+
+class TextRoundTripTest(TempDirTestCase):
+
+    def test_bases(self):
+        text = "Hello, 世界! 0123456789"
+        for base in (2, 3, 8, 10, 16):
+            with self.subTest(base=base):
+                _, img_path = TextToImageEncryptor(base=base).encrypt_to_image(text, self.path(f"text_{base}.png"))
+                self.assertEqual(ImageToTextDecryptor().decrypt_from_image(img_path), text)
+
+    def test_legacy_without_header(self):
+        # 旧格式每个字节固定两位，只有十六进制能无损还原
+        text = "Hello, 世界! 0123456789"
+        encryptor = TextToImageEncryptor(base=16, embed_header=False)
+        _, img_path = encryptor.encrypt_to_image(text, self.path("legacy.png"))
+        self.assertEqual(ImageToTextDecryptor(base=16).decrypt_from_image(img_path), text)
+
+    def test_image_modes(self):
+        text = "palette and bilevel images"
+        for base, image_mode in ((16, 'P'), (2, '1')):
+            with self.subTest(image_mode=image_mode):
+                encryptor = TextToImageEncryptor(base=base, image_mode=image_mode)
+                _, img_path = encryptor.encrypt_to_image(text, self.path(f"mode_{image_mode}.png"))
+                self.assertEqual(ImageToTextDecryptor().decrypt_from_image(img_path), text)
+
+    def test_file_round_trip(self):
+        data = bytes(range(256)) * 8
+        file_path = self.path("payload.bin")
+        with open(file_path, 'wb') as file:
+            file.write(data)
+        _, img_path = FileToImageEncryptor(base=16).encrypt_file_to_image(file_path, self.path("file.png"))
+        output_dir = self.path("out")
+        os.makedirs(output_dir)
+        output_path = ImageToFileDecryptor().decrypt_image_to_file(img_path, output_dir)[0]
+        with open(output_path, 'rb') as file:
+            self.assertEqual(file.read(), data)
+
+
+class FileContainerTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        data = b"\x00\x01payload\xff"
+        container_bytes = pack_file_header("报告.txt", len(data)) + data
+        self.assertEqual(file_container_length(container_bytes), len(container_bytes))
+        container = unpack_file_container(container_bytes + b"\x00" * 5)
+        self.assertEqual(container.file_name, "报告.txt")
+        self.assertEqual(container.data, data)
+        self.assertEqual((container.part_index, container.part_count, container.offset, container.total_size),
+                         (0, 1, 0, len(data)))
+
+    def test_part_round_trip(self):
+        data = b"second part"
+        container_bytes = pack_file_header("big.bin", len(data), part=(1, 3, 4096, 10000)) + data
+        container = unpack_file_container(container_bytes)
+        self.assertTrue(container.flags & FILE_FLAG_PART)
+        self.assertEqual(container.data, data)
+        self.assertEqual((container.part_index, container.part_count, container.offset, container.total_size),
+                         (1, 3, 4096, 10000))
+
+    def test_corrupted_input(self):
+        container_bytes = pack_file_header("a.txt", 4) + b"data"
+        with self.assertRaises(ValueError):
+            unpack_file_container(b"XXXX" + container_bytes[4:])
+        with self.assertRaises(ValueError):
+            unpack_file_container(container_bytes[:-1])
+        with self.assertRaises(ValueError):
+            file_container_length(FILE_CONTAINER_MAGIC)
+
+
+class ImageHeaderTest(unittest.TestCase):
+
+    @staticmethod
+    def header_image(header, width, height):
+        """
+        生成只包含格式头的白色图片
+        """
+        pixels = np.full((height, width), 255, dtype=np.uint8)
+        pixels[:image_header_rows(width)][image_header_bits(header, width)] = 0
+        return Image.fromarray(pixels).convert('RGB')
+
+    def test_round_trip(self):
+        digits = np.arange(40, dtype=np.uint8) % 16
+        header = pack_image_header(16, 3, 4, 10, digits)
+        image = self.header_image(header, 30, image_header_rows(30) + 4 * 4)
+        parsed = read_image_header(image)
+        self.assertEqual(parsed.version, IMAGE_HEADER_VERSION)
+        self.assertEqual((parsed.base, parsed.block_width, parsed.block_height, parsed.columns, parsed.digit_count),
+                         (16, 3, 4, 10, 40))
+
+    def test_corrupted_input(self):
+        digits = np.zeros(40, dtype=np.uint8)
+        header = pack_image_header(16, 3, 4, 10, digits)
+        height = image_header_rows(30) + 4 * 4
+
+        # 魔数不符时视为不带格式头的旧格式图片
+        self.assertIsNone(read_image_header(self.header_image(b"XXXX" + header[4:], 30, height)))
+        self.assertIsNone(read_image_header(Image.new('RGB', (30, 1), 'white')))
+
+        version = header[:4] + bytes([IMAGE_HEADER_VERSION + 1]) + header[5:]
+        with self.assertRaises(ValueError):
+            read_image_header(self.header_image(version, 30, height))
+        # 网格超出图片尺寸
+        with self.assertRaises(ValueError):
+            read_image_header(self.header_image(header, 30, height - 1))
+        bad_base = header[:6] + bytes([17]) + header[7:]
+        with self.assertRaises(ValueError):
+            read_image_header(self.header_image(bad_base, 30, height))
+        with self.assertRaises(ValueError):
+            pack_image_header(16, 256, 4, 10, digits)
+
+    def test_crc_mismatch(self):
+        encryptor = TextToImageEncryptor(base=16, block_width=4, block_height=4)
+        with tempfile.TemporaryDirectory() as temp_dir, contextlib.redirect_stdout(io.StringIO()):
+            _, img_path = encryptor.encrypt_to_image("checksum", os.path.join(temp_dir, "crc.png"))
+            with Image.open(img_path) as img:
+                image = img.convert('RGB')
+            # 改变最后一个块的颜色，格式头仍然有效但CRC不符
+            pixels = np.array(image)
+            top = image_header_rows(image.size[0])
+            pixels[top:top + 4, 0:4] = (0, 0, 0) if pixels[top, 0].any() else (255, 0, 0)
+            corrupted_path = os.path.join(temp_dir, "corrupted.png")
+            Image.fromarray(pixels).save(corrupted_path)
+            with self.assertRaises(ValueError):
+                ImageToTextDecryptor().decrypt_from_image(corrupted_path)
+
+
+class PNGMetadataTest(TempDirTestCase):
+
+    def save_with_text(self, text):
+        path = self.path("metadata.png")
+        info = PngImagePlugin.PngInfo()
+        for key, value in (text or {}).items():
+            info.add_text(key, value)
+        Image.new('RGB', (4, 4), 'white').save(path, pnginfo=info)
+        return path
+
+    def test_round_trip(self):
+        metadata = {'version': PNG_METADATA_VERSION, 'payload': 'file', 'base': 16, 'block_width': 9,
+                    'block_height': 16, 'columns': 88, 'rows': 3, 'digits': 250, 'header': 1, 'fixed_width': 1,
+                    'file_name': '报告.txt', 'file_size': 123}
+        path = self.path("metadata.png")
+        Image.new('RGB', (4, 4), 'white').save(path, pnginfo=png_info(metadata))
+        with Image.open(path) as img:
+            self.assertEqual(read_png_metadata(img), metadata)
+
+    def test_missing_metadata(self):
+        with Image.open(self.save_with_text(None)) as img:
+            self.assertIsNone(read_png_metadata(img))
+
+    def test_invalid_values(self):
+        for text in ({PNG_METADATA_PREFIX + 'version': str(PNG_METADATA_VERSION), PNG_METADATA_PREFIX + 'base': 'x'},
+                     {PNG_METADATA_PREFIX + 'version': str(PNG_METADATA_VERSION + 1)},
+                     {PNG_METADATA_PREFIX + 'base': '16'}):
+            with self.subTest(text=text):
+                with Image.open(self.save_with_text(text)) as img:
+                    with self.assertRaises(ValueError):
+                        read_png_metadata(img)
+
+
+class PNGStreamWriterTest(TempDirTestCase):
+
+    def test_rgb_and_palette(self):
+        rng = np.random.default_rng(0)
+        rgb = rng.integers(0, 256, (37, 23, 3), dtype=np.uint8)
+        path = self.path("rgb.png")
+        with PNGStreamWriter(path, 23, 37, text={'Comment': '说明'}) as writer:
+            writer.write_rows(rgb[:10].reshape(10, -1))
+            writer.write_rows(rgb[10:].reshape(27, -1))
+        with Image.open(path) as img:
+            self.assertEqual(img.info['Comment'], '说明')
+            np.testing.assert_array_equal(np.asarray(img), rgb)
+
+        palette = rng.integers(0, 256, (16, 3), dtype=np.uint8)
+        indices = rng.integers(0, 16, (20, 31), dtype=np.uint8)
+        path = self.path("palette.png")
+        with PNGStreamWriter(path, 31, 20, color_type=3, palette=palette) as writer:
+            writer.write_rows(indices)
+        with Image.open(path) as img:
+            np.testing.assert_array_equal(np.asarray(img.convert('RGB')), palette[indices])
+
+    def test_incomplete_file_removed(self):
+        path = self.path("short.png")
+        writer = PNGStreamWriter(path, 4, 4)
+        writer.write_rows(np.zeros((3, 12), dtype=np.uint8))
+        with self.assertRaises(ValueError):
+            writer.close()
+        self.assertFalse(os.path.exists(path))
+
+        path = self.path("failed.png")
+        with self.assertRaises(RuntimeError):
+            with PNGStreamWriter(path, 4, 4):
+                raise RuntimeError("render failed")
+        self.assertFalse(os.path.exists(path))
+
+    def test_chunks_are_valid(self):
+        path = self.path("chunks.png")
+        with PNGStreamWriter(path, 2, 2) as writer:
+            writer.write_rows(np.zeros((2, 6), dtype=np.uint8))
+        with open(path, 'rb') as file:
+            data = file.read()
+        # 逐块校验长度和CRC，第一块为IHDR，最后一块为IEND
+        self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+        position, chunk_types = 8, []
+        while position < len(data):
+            length, = struct.unpack_from('>I', data, position)
+            chunk_type = data[position + 4:position + 8]
+            chunk_data = data[position + 8:position + 8 + length]
+            crc, = struct.unpack_from('>I', data, position + 8 + length)
+            self.assertEqual(crc, zlib.crc32(chunk_data, zlib.crc32(chunk_type)))
+            chunk_types.append(chunk_type)
+            position += 12 + length
+        self.assertEqual(position, len(data))
+        self.assertEqual(chunk_types[0], b'IHDR')
+        self.assertEqual(chunk_types[-1], b'IEND')
+
+    def test_streamed_matches_in_memory(self):
+        text = "流式写入与内存中生成的图片逐像素一致。" * 40
+        for base, image_mode, embed_header in ((16, 'RGB', True), (16, 'P', True), (2, '1', True), (10, 'RGB', False)):
+            with self.subTest(base=base, image_mode=image_mode, embed_header=embed_header):
+                encryptor = TextToImageEncryptor(block_width=2, block_height=3, base=base, image_mode=image_mode,
+                                                 embed_header=embed_header)
+                _, memory_path = encryptor.encrypt_to_image(text, self.path(f"memory_{image_mode}.png"), 120)
+                _, stream_path = encryptor.encrypt_to_image(text, self.path(f"stream_{image_mode}.png"), 120,
+                                                            streaming=True)
+                with Image.open(memory_path) as memory_img, Image.open(stream_path) as stream_img:
+                    self.assertEqual(memory_img.size, stream_img.size)
+                    self.assertEqual(read_png_metadata(memory_img), read_png_metadata(stream_img))
+                    np.testing.assert_array_equal(np.asarray(memory_img.convert('RGB')),
+                                                  np.asarray(stream_img.convert('RGB')))
+
+
+if __name__ == '__main__':
+    unittest.main()